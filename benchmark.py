@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import itertools
+import json
+import random
+import resource
+import signal
+import sys
+from multiprocessing import Pool
+from timeit import default_timer
+
+# local imports
+from driver import on_timeout
+from engines import ENGINES
+from tree import Tree
+
+# search strategies that can be benchmarked, by Tree method name
+STRATEGIES = ('bfts', 'external_bfts', 'id_dfts', 'grbefgs', 'astargs', 'beam')
+
+# puzzle parameters that make up the benchmark grid, in puzzle file order
+PARAMETERS = ('quota', 'max_swaps', 'num_device_types', 'width', 'height', 'pool_height')
+
+# columns of a result row, in the order they're written out
+FIELDS = (('strategy', 'engine', 'seed') + PARAMETERS +
+          ('status', 'score', 'nodes', 'wall_time', 'nodes_per_sec', 'peak_rss_kb'))
+
+# metrics checked by compare mode, and whether a higher value is better
+METRICS = (('wall_time', False), ('nodes_per_sec', True), ('peak_rss_kb', False))
+
+
+def generate_puzzle(seed, quota, max_swaps, num_device_types, width, height, pool_height):
+    """Generates a random puzzle file. The same seed and parameters always
+    give the same puzzle.
+
+    Args:
+        seed: The seed of the puzzle.
+        quota: Our target score.
+        max_swaps: The maximum number of swaps allowed.
+        num_device_types: The number of device types.
+        width: The width of the board.
+        height: The height of the board.
+        pool_height: The height of our pool.
+
+    Returns:
+        The lines of the puzzle file.
+    """
+
+    # seed with every parameter, so no two cells of the grid share a board
+    rng = random.Random("{}:{}:{}:{}:{}:{}:{}".format(
+        seed, quota, max_swaps, num_device_types, width, height, pool_height))
+
+    lines = [str(value) for value in
+             (quota, max_swaps, num_device_types, width, height, pool_height, 0)]
+    lines += [' '.join(str(rng.randint(1, num_device_types)) for x in range(width))
+              for y in range(height)]
+
+    return lines
+
+
+def run_case(case, time_cap, memory_cap):
+    """Runs one strategy on one generated puzzle, in a fresh worker process so
+    that its peak RSS is its own.
+
+    Args:
+        case: A dict of the strategy, engine, seed and puzzle parameters.
+        time_cap: Seconds the run may take.
+        memory_cap: Megabytes the worker may allocate, or None for no limit.
+
+    Returns:
+        The case, extended with the results of the run.
+    """
+
+    if memory_cap:
+        limit = memory_cap << 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    lines = generate_puzzle(case['seed'], *(case[name] for name in PARAMETERS))
+    tree = None
+    status = 'ok'
+
+    signal.signal(signal.SIGALRM, on_timeout)
+    start_time = default_timer()
+    signal.setitimer(signal.ITIMER_REAL, time_cap)
+
+    try:
+        tree = Tree(ENGINES[case['engine']](*lines[:7], lines[7:]))
+        getattr(tree, case['strategy'])()
+    except TimeoutError:
+        status = 'timeout'
+    except MemoryError:
+        status = 'memory'
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    wall_time = default_timer() - start_time
+    nodes = tree.nodes if tree else 0
+
+    # a capped run still reports the best it got to
+    result = dict(case)
+    result.update(
+        status=status,
+        score=tree.max_node.state.score if tree else 0,
+        nodes=nodes,
+        wall_time=round(wall_time, 6),
+        nodes_per_sec=round(nodes / wall_time, 1) if wall_time else 0.0,
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+    return result
+
+
+def run(args):
+    """Runs every strategy over the grid of generated puzzles and writes the
+    results.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+
+    grid = itertools.product(args.strategies, range(args.seeds),
+                             *(getattr(args, name) for name in PARAMETERS))
+    cases = [dict(zip(('strategy', 'seed') + PARAMETERS, values), engine=args.engine)
+             for values in grid]
+
+    # a fresh worker per case, so peak RSS and the memory cap are per run: a
+    # task is a whole chunk of cases, so chunks must hold a single case
+    with Pool(args.jobs, maxtasksperchild=1) as pool:
+        results = pool.starmap(run_case, [(case, args.time_cap, args.memory_cap)
+                                          for case in cases], chunksize=1)
+
+    write_results(results, args.output)
+
+    print("{} runs written to {}".format(len(results), args.output))
+
+
+def write_results(results, path):
+    """Writes result rows to a JSON or CSV file, by extension.
+
+    Args:
+        results: A list of result dicts.
+        path: The name of the file to write.
+    """
+
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            json.dump([{field: result[field] for field in FIELDS} for result in results],
+                      f, indent=2)
+
+
+def read_results(path):
+    """Reads result rows from a JSON or CSV file, by extension.
+
+    Args:
+        path: The name of the file to read.
+
+    Returns:
+        A dict of result dicts keyed by case.
+    """
+
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            results = list(csv.DictReader(f))
+        else:
+            results = json.load(f)
+
+    # csv leaves every value a string, so numbers are read back from it
+    for result in results:
+        for field in FIELDS[2:]:
+            if field != 'status':
+                result[field] = float(result[field])
+
+    return {tuple(result[field] for field in FIELDS[:9]): result for result in results}
+
+
+def compare(args):
+    """Compares two benchmark runs case by case and prints any regressions.
+
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        The number of regressions found.
+    """
+
+    old, new = read_results(args.old), read_results(args.new)
+    regressions = []
+
+    for case in sorted(old.keys() & new.keys(), key=str):
+        before, after = old[case], new[case]
+        name = "{} seed={:g} {}".format(case[0], case[2], ' '.join(
+            "{}={:g}".format(parameter, value) for parameter, value in zip(PARAMETERS, case[3:])))
+
+        if before['status'] == 'ok' and after['status'] != 'ok':
+            regressions.append((name, 'status', before['status'], after['status']))
+
+        if after['score'] < before['score']:
+            regressions.append((name, 'score', before['score'], after['score']))
+
+        # timings of capped runs, or of runs too short to time, are just noise
+        if (before['status'] != 'ok' or after['status'] != 'ok' or
+                max(before['wall_time'], after['wall_time']) < args.min_time):
+            continue
+
+        for metric, higher_is_better in METRICS:
+            change = (after[metric] - before[metric]) / (before[metric] or 1)
+
+            if (-change if higher_is_better else change) > args.threshold:
+                regressions.append((name, metric, before[metric], after[metric]))
+
+    for name, metric, before, after in regressions:
+        print("{}: {} {:g} -> {:g}".format(name, metric, before, after)
+              if metric != 'status' else "{}: status {} -> {}".format(name, before, after))
+
+    print("{} regressions in {} common runs".format(len(regressions), len(old.keys() & new.keys())))
+
+    return len(regressions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search strategies on "
+                                                 "generated puzzles.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="run the benchmark grid")
+    run_parser.add_argument('output', help="the file to write results to (.json or .csv)")
+    run_parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=STRATEGIES,
+                            help="the strategies to run (default: all)")
+    run_parser.add_argument('--engine', choices=ENGINES, default='regex',
+                            help="the match detection engine to use (default: regex)")
+    run_parser.add_argument('--seeds', type=int, default=3,
+                            help="the number of puzzles per cell of the grid (default: 3)")
+    run_parser.add_argument('--quota', nargs='+', type=int, default=[50, 100])
+    run_parser.add_argument('--max-swaps', nargs='+', type=int, default=[10])
+    run_parser.add_argument('--num-device-types', nargs='+', type=int, default=[4])
+    run_parser.add_argument('--width', nargs='+', type=int, default=[6, 8])
+    run_parser.add_argument('--height', nargs='+', type=int, default=[12])
+    run_parser.add_argument('--pool-height', nargs='+', type=int, default=[4])
+    run_parser.add_argument('--time-cap', type=float, default=10,
+                            help="seconds each run may take (default: 10)")
+    run_parser.add_argument('--memory-cap', type=int, default=1024,
+                            help="megabytes each run may allocate, 0 for no limit "
+                                 "(default: 1024)")
+    run_parser.add_argument('--jobs', type=int, default=1,
+                            help="the number of runs at once, which skews timings "
+                                 "(default: 1)")
+
+    compare_parser = subparsers.add_parser('compare', help="flag regressions between two runs")
+    compare_parser.add_argument('old', help="the results to compare against")
+    compare_parser.add_argument('new', help="the results to check")
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="relative change that counts as a regression "
+                                     "(default: 0.1)")
+    compare_parser.add_argument('--min-time', type=float, default=0.1,
+                                help="seconds below which timings aren't compared "
+                                     "(default: 0.1)")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif compare(args):
+        sys.exit(1)
@@ -0,0 +1,315 @@
+from puzzle import Puzzle
+
+
+class BitboardPuzzle(Puzzle):
+    """A puzzle that finds matches with integer bitboards instead of regexes.
+
+    Each device type gets a bitboard holding one byte per cell, set to 1 where
+    the cell holds that device, so bit 8*i stands for board index i. Three of
+    a device in a row then show up in b & b >> 8 & b >> 16, and three in a
+    column in the same expression with the shifts scaled by the row stride.
+    Matches are identical to the ones Puzzle finds, including only reporting
+    the leftmost (or topmost) series in each row (or column)."""
+
+    __slots__ = ()
+
+    # masks for each set of board dimensions, built on first use
+    masks = {}
+
+    # bytes.translate tables that turn a board into a bitboard, per device
+    tables = {}
+
+    def get_masks(self):
+        """Returns the masks for this puzzle's dimensions.
+
+        Returns:
+            A tuple of the masks of valid horizontal series starts, valid
+            vertical series starts, each row and each column. Series can only
+            start below the pool and far enough from the board's edge.
+        """
+
+        dimensions = (self.width, self.height, self.pool_height)
+
+        if dimensions not in BitboardPuzzle.masks:
+            row_bits = sum(1 << 8*x for x in range(self.width))
+            col_bits = sum(1 << 8*self.width*y for y in range(self.height))
+
+            rows = [row_bits << 8*self.width*y for y in range(self.height)]
+            cols = [col_bits << 8*x for x in range(self.width)]
+
+            # horizontal series need two more cells to their right
+            h_starts = sum(rows[self.pool_height:]) & sum(cols[:self.width-2])
+
+            # vertical series need two more cells below them
+            v_starts = sum(rows[self.pool_height:self.height-2])
+
+            BitboardPuzzle.masks[dimensions] = (h_starts, v_starts, rows, cols)
+
+        return BitboardPuzzle.masks[dimensions]
+
+    def get_bitboards(self):
+        """Builds a bitboard for every device type.
+
+        Returns:
+            A list of bitboards indexed by device number (EMPTY has none).
+        """
+
+        if self.num_device_types not in BitboardPuzzle.tables:
+            BitboardPuzzle.tables[self.num_device_types] = [
+                bytes(int(i == device) for i in range(256))
+                for device in range(self.num_device_types + 1)]
+
+        tables = BitboardPuzzle.tables[self.num_device_types]
+
+        return [0] + [int.from_bytes(self.board.translate(tables[device]), 'little')
+                      for device in range(1, self.num_device_types + 1)]
+
+    def get_starts(self, bitboard):
+        """Finds where series of three start on a single bitboard.
+
+        Args:
+            bitboard: The bitboard of one device type.
+
+        Returns:
+            A tuple of the horizontal and vertical series start bitboards.
+        """
+
+        h_starts, v_starts = self.get_masks()[:2]
+        stride = 8 * self.width
+
+        return (bitboard & bitboard >> 8 & bitboard >> 16 & h_starts,
+                bitboard & bitboard >> stride & bitboard >> 2*stride & v_starts)
+
+    def get_row_match(self, h_starts, y):
+        """Reads the leftmost series in a row off the horizontal starts.
+
+        Args:
+            h_starts: Horizontal series start bitboard.
+            y: The y coordinate of the row.
+
+        Returns:
+            A list of locations of matching devices within the row.
+        """
+
+        starts = h_starts & self.get_masks()[2][y]
+
+        if not starts:
+            return []
+
+        # the lowest set bit is the leftmost start
+        start = ((starts & -starts).bit_length() - 1) // 8
+        device = self.board[start]
+        end = start + 3
+
+        # extend the series for as long as the device repeats in the row
+        while end % self.width and self.board[end] == device:
+            end += 1
+
+        return [(i % self.width, y) for i in range(start, end)]
+
+    def get_column_match(self, v_starts, x):
+        """Reads the topmost series in a column off the vertical starts.
+
+        Args:
+            v_starts: Vertical series start bitboard.
+            x: The x coordinate of the column.
+
+        Returns:
+            A list of locations of matching devices within the column.
+        """
+
+        starts = v_starts & self.get_masks()[3][x]
+
+        if not starts:
+            return []
+
+        # the lowest set bit is the topmost start
+        start = ((starts & -starts).bit_length() - 1) // 8 // self.width
+        device = self.board[start*self.width + x]
+        end = start + 3
+
+        # extend the series for as long as the device repeats in the column
+        while end < self.height and self.board[end*self.width + x] == device:
+            end += 1
+
+        return [(x, y) for y in range(start, end)]
+
+    def get_all_starts(self, bitboards):
+        """Combines the series starts of every device type.
+
+        Args:
+            bitboards: The bitboards of every device type.
+
+        Returns:
+            A tuple of the horizontal and vertical series start bitboards.
+        """
+
+        h_starts = v_starts = 0
+
+        for bitboard in bitboards:
+            h, v = self.get_starts(bitboard)
+            h_starts |= h
+            v_starts |= v
+
+        return h_starts, v_starts
+
+    def get_swap_matches(self, h_starts, v_starts, dev1, dev2):
+        """Reads the matches near two swapped devices off the series starts.
+        See Puzzle.get_matches.
+
+        Args:
+            h_starts: Horizontal series start bitboard.
+            v_starts: Vertical series start bitboard.
+            dev1: The first device.
+            dev2: The second device.
+
+        Returns:
+            A list of locations of matching devices on the board.
+        """
+
+        # horizontal swap
+        if dev1[0] != dev2[0]:
+            return (self.get_row_match(h_starts, dev1[1]) +
+                    self.get_column_match(v_starts, dev1[0]) +
+                    self.get_column_match(v_starts, dev2[0]))
+        # vertical swap
+        else:
+            return (self.get_row_match(h_starts, dev1[1]) +
+                    self.get_row_match(h_starts, dev2[1]) +
+                    self.get_column_match(v_starts, dev1[0]))
+
+    def get_matches(self, dev1, dev2):
+        """Return just the matches that occur near the swapped devices, using
+        bitboards rather than regexes. See Puzzle.get_matches.
+
+        Args:
+            dev1: The first device.
+            dev2: The second device.
+
+        Returns:
+            A list of locations of matching devices on the board.
+        """
+
+        h_starts, v_starts = self.get_all_starts(self.get_bitboards())
+
+        return self.get_swap_matches(h_starts, v_starts, dev1, dev2)
+
+    def get_all_matches(self):
+        """Returns all matches, using bitboards rather than regexes. See
+        Puzzle.get_all_matches.
+
+        Returns:
+            A list of locations of matching devices on the board.
+        """
+
+        h_starts, v_starts = self.get_all_starts(self.get_bitboards())
+        matches = []
+
+        for y in range(self.pool_height, self.height):
+            matches += self.get_row_match(h_starts, y)
+
+        for x in range(self.width):
+            matches += self.get_column_match(v_starts, x)
+
+        return matches
+
+    def get_region_matches(self, bottom, columns):
+        """Returns the matches in the rows down to bottom and the given
+        columns, using bitboards rather than regexes. See
+        Puzzle.get_region_matches.
+
+        Args:
+            bottom: The lowest row that changed.
+            columns: The x coordinates of the columns that changed.
+
+        Returns:
+            A list of locations of matching devices on the board.
+        """
+
+        h_starts, v_starts = self.get_all_starts(self.get_bitboards())
+        matches = []
+
+        for y in range(self.pool_height, bottom + 1):
+            matches += self.get_row_match(h_starts, y)
+
+        for x in sorted(columns):
+            matches += self.get_column_match(v_starts, x)
+
+        return matches
+
+    def get_swapped_starts(self, bitboards, others, i1, i2):
+        """Finds the series starts the board would have with two devices
+        swapped, by moving two bits between the swapped devices' bitboards.
+
+        Args:
+            bitboards: The bitboards of every device type, before the swap.
+            others: Cache of the combined series starts of every device type
+                but a swapped pair, keyed by the pair.
+            i1: The flat board index of the first device.
+            i2: The flat board index of the second device.
+
+        Returns:
+            A tuple of the horizontal and vertical series start bitboards.
+        """
+
+        device1, device2 = self.board[i1], self.board[i2]
+
+        # swapping two of the same device leaves the board as it was
+        if device1 == device2:
+            return self.get_all_starts(bitboards)
+
+        if (device1, device2) not in others:
+            others[device1, device2] = self.get_all_starts(
+                bitboard for device, bitboard in enumerate(bitboards)
+                if device not in (device1, device2))
+
+        h_starts, v_starts = others[device1, device2]
+        bits = 1 << 8*i1 | 1 << 8*i2
+
+        for device in (device1, device2):
+            h, v = self.get_starts(bitboards[device] ^ bits)
+            h_starts |= h
+            v_starts |= v
+
+        return h_starts, v_starts
+
+    def test_swaps(self, indices):
+        """Simulate swaps on the bitboards and return only those that would
+        result in a match. The board is only touched, and put back, to read
+        off the matches of a swap once it's known to have some.
+
+        Args:
+            indices: The indices of the swaps to test in the swap table.
+
+        Returns:
+            A dict mapping the index of each swap that results in at least one
+            match to the number of devices that match.
+        """
+
+        swaps = self.get_swap_table()[0]
+        bitboards = self.get_bitboards()
+        rows, cols = self.get_masks()[2:]
+        board = self.board
+        others = {}
+        valid = {}
+
+        for k in indices:
+            dev1, dev2 = swaps[k]
+            i1 = dev1[1] * self.width + dev1[0]
+            i2 = dev2[1] * self.width + dev2[0]
+
+            h_starts, v_starts = self.get_swapped_starts(bitboards, others, i1, i2)
+
+            # horizontal swap
+            if dev1[0] != dev2[0]:
+                lines = (rows[dev1[1]], cols[dev1[0]] | cols[dev2[0]])
+            # vertical swap
+            else:
+                lines = (rows[dev1[1]] | rows[dev2[1]], cols[dev1[0]])
+
+            if h_starts & lines[0] or v_starts & lines[1]:
+                board[i1], board[i2] = board[i2], board[i1]
+                valid[k] = len(self.get_swap_matches(h_starts, v_starts, dev1, dev2))
+                board[i1], board[i2] = board[i2], board[i1]
+
+        return valid
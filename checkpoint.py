@@ -0,0 +1,302 @@
+import os
+import pickle
+from collections import deque
+from timeit import default_timer
+
+# local imports
+from node import Successor
+
+
+class Checkpoint:
+    """Takes periodic snapshots of an astargs or bfts search, and resumes a
+    search from the last one, so that a search that's killed can go on where
+    it left off and reach the same result it would have uninterrupted.
+
+    A snapshot holds every node the search still refers to as the index of its
+    parent and the swap that led to it, and rebuilds the nodes by replaying
+    the swaps, along with the frontier (with the keys and order it had), the
+    explored set, the dominance table, the max node and the generated count.
+
+    Snapshots are taken as a node is about to be expanded, and that node is
+    the first one expanded on resuming. Where processes can be forked, each
+    snapshot is written by a forked copy of the search, so the search itself
+    only pauses for the fork and never waits on the disk."""
+
+    # version of the snapshot format, which must match to resume
+    VERSION = 2
+
+    def __init__(self, path, interval=None, resume=False):
+        """Initializes a Checkpoint instance.
+
+        Args:
+            path: The name of the snapshot file.
+            interval: Seconds between snapshots, or None to take none.
+            resume: Whether to resume from the snapshot file, if it exists.
+        """
+
+        self.path = path
+        self.interval = interval
+        self.resume = resume
+
+        self.saves = 0          # snapshots taken
+        self.child = None       # process writing the last snapshot, if any
+        self.get_moves = None   # the tree's get_moves, before it was watched
+
+    def start(self, tree, frontier, explored):
+        """Resumes a search from the snapshot file if asked to, and starts
+        taking snapshots of it.
+
+        Args:
+            tree: The Tree being searched.
+            frontier: The search's frontier, a deque (bfts) or PriorityQueue
+                (astargs), of nodes or of Successor instances if the tree is
+                lazy.
+            explored: The search's explored set, or None if it has none.
+
+        Returns:
+            The node the snapshot was taken at, which is yet to be expanded,
+            or None if the search starts afresh.
+
+        Raises:
+            ValueError: If the snapshot is of another puzzle or search.
+        """
+
+        node = None
+
+        if self.resume and os.path.exists(self.path):
+            node = self.load(tree, frontier, explored)
+
+        if self.interval is not None:
+            self.watch(tree, frontier, explored)
+
+        return node
+
+    def finish(self, tree):
+        """Stops taking snapshots of a search that's done, and removes the
+        snapshot file once the last one is written, as there's nothing left to
+        resume.
+
+        Args:
+            tree: The Tree being searched.
+        """
+
+        if self.get_moves is not None:
+            tree.get_moves = self.get_moves
+            self.get_moves = None
+
+        if self.child is not None:
+            os.waitpid(self.child, 0)
+            self.child = None
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def watch(self, tree, frontier, explored):
+        """Swaps a tree's move generation for one that takes a snapshot first
+        whenever one is due, as a node is about to be expanded.
+
+        Args:
+            tree: The Tree being searched.
+            frontier: The search's frontier.
+            explored: The search's explored set, or None.
+        """
+
+        get_moves = self.get_moves = tree.get_moves
+        due = default_timer() + self.interval
+
+        def watched_get_moves(node):
+            nonlocal due
+
+            if default_timer() >= due:
+                self.save(tree, frontier, explored, node)
+                due = default_timer() + self.interval
+
+            return get_moves(node)
+
+        tree.get_moves = watched_get_moves
+
+    def save(self, tree, frontier, explored, pending):
+        """Takes a snapshot, in a forked process where possible. If the last
+        snapshot is still being written, this one is skipped.
+
+        Args:
+            tree: The Tree being searched.
+            frontier: The search's frontier.
+            explored: The search's explored set, or None.
+            pending: The node about to be expanded.
+        """
+
+        if self.child is not None:
+            if os.waitpid(self.child, os.WNOHANG)[0] == 0:
+                return
+
+            self.child = None
+
+        self.saves += 1
+
+        if not hasattr(os, 'fork'):
+            self.write(tree, frontier, explored, pending)
+            return
+
+        self.child = os.fork()
+
+        # the forked copy writes the search as it was at the fork, and leaves
+        # without running any of the search's exit handlers
+        if self.child == 0:
+            status = 1
+
+            try:
+                self.write(tree, frontier, explored, pending)
+                status = 0
+            finally:
+                os._exit(status)
+
+    def write(self, tree, frontier, explored, pending):
+        """Writes a snapshot in one step, so that a search killed halfway
+        through (or resuming) never sees a partly written one.
+
+        Args:
+            tree: The Tree being searched.
+            frontier: The search's frontier.
+            explored: The search's explored set, or None.
+            pending: The node about to be expanded.
+        """
+
+        # nodes by identity, as equal nodes can still have different paths
+        ids = {id(tree.root): 0}
+        nodes = [(None, None)]
+
+        def get_id(node):
+            if id(node) not in ids:
+                parent = get_id(node.parent)
+                ids[id(node)] = len(nodes)
+                nodes.append((parent, node.action))
+
+            return ids[id(node)]
+
+        snapshot = {
+            'version': Checkpoint.VERSION,
+            'search': self.get_search(tree, frontier),
+            'puzzle': self.get_puzzle(tree),
+            'pending': get_id(pending),
+            'max_node': get_id(tree.max_node),
+            'generated': tree.nodes,
+            'fronts': tree.dominance.fronts,
+            'dominated': tree.dominance.dominated,
+            'explored': [get_id(node) for node in explored] if explored is not None else [],
+        }
+
+        if isinstance(frontier, deque):
+            snapshot['frontier'] = [get_id(node) for node in frontier]
+        elif not tree.lazy:
+            entries, snapshot['counter'] = frontier.get_entries()
+            snapshot['frontier'] = [(key, tiebreak, get_id(node))
+                                    for key, tiebreak, node in entries]
+        else:
+            entries, snapshot['counter'] = frontier.get_entries()
+            snapshot['frontier'] = [
+                (key, tiebreak, get_id(successor.parent), successor.action, successor.cleared,
+                 get_id(successor.node) if successor.node is not None else None)
+                for key, tiebreak, successor in entries]
+
+        snapshot['nodes'] = nodes
+
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(self.path + '.tmp', self.path)
+
+    def load(self, tree, frontier, explored):
+        """Restores a search from the snapshot file.
+
+        Args:
+            tree: The Tree being searched, freshly set up.
+            frontier: The search's frontier, which is replaced.
+            explored: The search's explored set, or None.
+
+        Returns:
+            The node the snapshot was taken at, which is yet to be expanded.
+
+        Raises:
+            ValueError: If the snapshot is of another puzzle or search.
+        """
+
+        with open(self.path, 'rb') as f:
+            snapshot = pickle.load(f)
+
+        if snapshot.get('version') != Checkpoint.VERSION:
+            raise ValueError("{} is from another version of the solver".format(self.path))
+
+        if snapshot['search'] != self.get_search(tree, frontier):
+            raise ValueError("{} is a snapshot of another search".format(self.path))
+
+        if snapshot['puzzle'] != self.get_puzzle(tree):
+            raise ValueError("{} is a snapshot of another puzzle".format(self.path))
+
+        # replay the swaps, parents always come before their children
+        nodes = [tree.root]
+
+        for parent, action in snapshot['nodes'][1:]:
+            nodes.append(tree.expand(nodes[parent], action))
+
+        tree.nodes = snapshot['generated']
+        tree.max_node = nodes[snapshot['max_node']]
+        tree.dominance.fronts = snapshot['fronts']
+        tree.dominance.dominated = snapshot['dominated']
+
+        for i in snapshot['explored']:
+            explored.add(nodes[i])
+
+        if isinstance(frontier, deque):
+            frontier.clear()
+            frontier.extend(nodes[i] for i in snapshot['frontier'])
+        elif not tree.lazy:
+            frontier.set_entries([(key, tiebreak, nodes[i])
+                                  for key, tiebreak, i in snapshot['frontier']],
+                                 snapshot['counter'])
+        else:
+            entries = []
+
+            for key, tiebreak, parent, action, cleared, child in snapshot['frontier']:
+                successor = Successor(nodes[parent], action, cleared)
+                successor.node = nodes[child] if child is not None else None
+                entries.append((key, tiebreak, successor))
+
+            frontier.set_entries(entries, snapshot['counter'])
+
+        return nodes[snapshot['pending']]
+
+    @staticmethod
+    def get_search(tree, frontier):
+        """Names a search, so that a snapshot is only resumed by the same one.
+
+        Args:
+            tree: The Tree being searched.
+            frontier: The search's frontier.
+
+        Returns:
+            'bfts', or 'astargs' (or 'lazy astargs') and the name of its
+            heuristic.
+        """
+
+        if isinstance(frontier, deque):
+            return 'bfts'
+
+        return ('lazy astargs ' if tree.lazy else 'astargs ') + tree.heuristic.__name__
+
+    @staticmethod
+    def get_puzzle(tree):
+        """Describes the puzzle of a tree, so that a snapshot is only resumed
+        on the same one.
+
+        Args:
+            tree: The Tree being searched.
+
+        Returns:
+            A tuple of the root's board and the puzzle's parameters.
+        """
+
+        state = tree.root.state
+
+        return (bytes(state.board), state.quota, state.max_swaps, state.num_device_types,
+                state.width, state.height, state.pool_height)
@@ -0,0 +1,54 @@
+class DominanceTable:
+    """Represents the best (score, cost) pairs seen for each board. Boards are
+    keyed by their zobrist key. A board's future depends on nothing but the
+    board itself, so a state is no better than an earlier one on the same
+    board that had at least its score with no more swaps used. Such a state
+    is dominated, and expanding it can't lead anywhere the earlier one doesn't.
+
+    Only pairs that no other pair of their board dominates are kept, so each
+    board holds at most one pair per swap count."""
+
+    def __init__(self):
+        """Initializes an empty DominanceTable instance."""
+
+        self.fronts = {}        # maps each board's key to its (score, cost) pairs
+        self.dominated = 0      # states found dominated
+
+    def dominates(self, node):
+        """Check whether an earlier state on the same board dominates a node,
+        and record the node's score and cost if none does.
+
+        Args:
+            node: The node to check.
+
+        Returns:
+            True if the node is dominated and can be dropped, False otherwise.
+        """
+
+        score, cost = node.state.score, node.cost
+        front = self.fronts.get(node.state.key)
+
+        if front is None:
+            self.fronts[node.state.key] = [(score, cost)]
+            return False
+
+        for other_score, other_cost in front:
+            if other_score >= score and other_cost <= cost:
+                self.dominated += 1
+                return True
+
+        # the node dominates any pair it doesn't lose to on both counts
+        front[:] = [(other_score, other_cost) for other_score, other_cost in front
+                    if other_score > score or other_cost < cost]
+        front.append((score, cost))
+
+        return False
+
+    def __len__(self):
+        """Overload __len__ to return the number of boards seen.
+
+        Returns:
+            The number of boards in our table.
+        """
+
+        return len(self.fronts)
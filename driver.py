@@ -1,44 +1,566 @@
 #!/usr/bin/env python3
 
+import argparse
+import json
+import os
+import signal
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from timeit import default_timer
 
 # local imports
+from checkpoint import Checkpoint
+from engines import ENGINES
+from heuristics import HEURISTICS, needed_gain
+from packfile import PUZZLE_EXTENSION, SOLUTION_EXTENSION, SOLUTION_MAGIC, PackWriter, PuzzlePack
 from puzzle import Puzzle
 from tree import Tree
 
+# search strategies the driver can solve with, by Tree method name
+STRATEGIES = ('astargs', 'ida_star', 'beam', 'external_bfts')
 
-def main(puzzle_file):
-    """Main function of our program's driver. Times execution and prints results.
+# puzzles of a pack handed to a batch worker at a time
+PACK_CHUNK_SIZE = 64
+
+# puzzle packs this worker process has open, by file name
+packs = {}
+
+
+def solve(puzzle_file, **options):
+    """Solves a single puzzle file, see solve_puzzle.
 
     Args:
         puzzle_file: The name of the input file describing the puzzle.
+        options: The search options, see solve_puzzle.
+
+    Returns:
+        A tuple of the solution text and the score reached.
+
+    Raises:
+        IOError: If the puzzle file can't be read.
+        TypeError, ValueError: If the puzzle file is malformed.
     """
 
-    try:
-        with open(puzzle_file) as f:
-            puzzle_file = f.read()
-    except IOError as e:
-        sys.exit(e)
+    with open(puzzle_file) as f:
+        return solve_puzzle(f.read(), **options)
+
+
+def solve_puzzle(puzzle, engine=Puzzle, stats_file=None, best_file=None, **options):
+    """Solves a single puzzle. Times execution and builds the contents of its
+    solution file.
+
+    Args:
+        puzzle: The contents of the input file describing the puzzle.
+        engine: The Puzzle class whose match detection engine is used.
+        stats_file: The name of a file to dump search stats to as JSON, or
+            None to not collect them.
+        best_file: The name of a file to write every improved solution to as
+            soon as anytime A* finds it, or None.
+        options: The search options, see search.
+
+    Returns:
+        A tuple of the solution text and the score reached.
+
+    Raises:
+        TypeError, ValueError: If the puzzle is malformed, or its checkpoint
+            file is of another puzzle or search.
+    """
 
-    print(puzzle_file.strip())      # print input file
     start_time = default_timer()    # begin timer
+    lines = puzzle.splitlines()
+
+    def get_solution(score, swaps):
+        return '\n'.join([puzzle.strip(), str(score), swaps,
+                          str(default_timer() - start_time)])
+
+    def on_improve(tree, node):
+        if best_file is not None:
+            write_solution(best_file, get_solution(node.state.score, tree.show_swaps(node)))
+
+    # unpack puzzle init values, then pass the remainder as the board
+    tree, swaps = search(engine(*lines[:7], lines[7:]), stats=stats_file is not None,
+                         on_improve=on_improve, **options)
+
+    score = tree.max_node.state.score
+    solution = get_solution(score, swaps)
+
+    if stats_file is not None:
+        stats = dict(tree.get_stats(), score=score, time=default_timer() - start_time)
+
+        with open(stats_file, 'w') as f:
+            json.dump(stats, f, indent=2)
+
+    return solution, score
+
+
+def search(top, workers=1, strategy='astargs', cache_size=Tree.CACHE_SIZE, stats=False,
+           deadline=None, on_improve=None, heuristic=needed_gain, beam_width=Tree.BEAM_WIDTH,
+           beam_seed=None, cache=None, checkpoint_file=None, checkpoint_interval=None,
+           resume=False, spill_size=Tree.SPILL_SIZE, spill_dir=None, inexact=False, lazy=False):
+    """Searches a puzzle for a solution.
+
+    Args:
+        top: The Puzzle instance to solve.
+        workers: The number of processes searching the puzzle.
+        strategy: The name of the Tree search method to solve with.
+        cache_size: The most bytes the swap cache may hold.
+        stats: Whether to collect SearchStats on the search.
+        deadline: Seconds to search for with anytime A*, or None to run the
+            strategy to completion.
+        on_improve: A function called with the tree and each node that
+            becomes the best anytime A* found so far, or None.
+        heuristic: The function that ranks nodes for astargs.
+        beam_width: The most nodes beam keeps at each depth.
+        beam_seed: The seed of a stochastic beam, or None to keep the highest
+            scores.
+        cache: A SwapCache kept from earlier puzzles of the same dimensions,
+            device types and engine, or None for a new one of cache_size.
+        checkpoint_file: The name of the file search snapshots are written
+            to and resumed from, or None to not checkpoint the search.
+        checkpoint_interval: Seconds between snapshots, or None to take none.
+        resume: Whether to resume the search from its checkpoint file, if
+            there is one.
+        spill_size: The most bytes of states external_bfts holds in memory.
+        spill_dir: Where external_bfts keeps its layer files, or None for the
+            system's temporary directory.
+        inexact: Whether ida_star may prune on the gain bound, which is
+            faster but can miss goals, see Tree.can_reach_quota.
+        lazy: Whether astargs defers creating children until they reach the
+            front, which is faster but can take more swaps or expansions,
+            see Tree.next_node.
+
+    Returns:
+        A tuple of the Tree searched, whose max node is the solution, and
+        its swaps as displayed by Tree.show_swaps.
+
+    Raises:
+        ValueError: If the checkpoint file is of another puzzle or search.
+    """
+
+    tree = Tree(top, cache_size, stats, heuristic, cache)
+    tree.inexact = inexact
+    tree.lazy = lazy
+
+    if checkpoint_file is not None:
+        tree.checkpoint = Checkpoint(checkpoint_file, checkpoint_interval, resume)
+
+    # perform the search, the node it returns is also the max node
+    if deadline is not None:
+        def on_tree_improve(node):
+            if on_improve is not None:
+                on_improve(tree, node)
+
+        swaps = tree.anytime_astargs(deadline, on_tree_improve)
+    elif workers > 1:
+        swaps = tree.parallel_astargs(workers)
+    elif strategy == 'beam':
+        swaps = tree.beam(beam_width, beam_seed)
+    elif strategy == 'external_bfts':
+        swaps = tree.external_bfts(spill_size, spill_dir)
+    else:
+        swaps = getattr(tree, strategy)()
+
+    return tree, swaps
+
+
+def main(puzzle_file, stats=False, **options):
+    """Main function of our program's driver. Solves a puzzle and prints results.
+
+    Args:
+        puzzle_file: The name of the input file describing the puzzle.
+        stats: Whether to dump search stats next to where run.sh would put
+            the solution.
+        options: The search options, see solve.
+    """
+
+    if stats:
+        options['stats_file'] = get_stats_file(get_solution_file(puzzle_file, '.'))
 
-    puzzle_file = puzzle_file.splitlines()
+    if options.get('checkpoint_interval') is not None or options.get('resume'):
+        options['checkpoint_file'] = get_checkpoint_file(get_solution_file(puzzle_file, '.'))
 
     try:
-        # unpack puzzle init values, then pass the remainder as the board
-        tree = Tree(Puzzle(*puzzle_file[:7], puzzle_file[7:]))
-    except (TypeError, ValueError) as e:
+        solution = solve(puzzle_file, **options)[0]
+    except (IOError, TypeError, ValueError) as e:
         sys.exit(e)
 
-    # perform A* graph search and print results
-    print(tree.astargs())
-    print(default_timer() - start_time)
+    print(solution)
+
+
+def write_solution(solution_file, solution):
+    """Writes a solution file in one step, so that a reader (or a process
+    killed halfway) never sees a partly written one.
+
+    Args:
+        solution_file: The name of the solution file.
+        solution: The solution text.
+    """
+
+    with open(solution_file + '.tmp', 'w') as f:
+        print(solution, file=f)
+
+    os.replace(solution_file + '.tmp', solution_file)
+
+
+def get_solution_file(puzzle_file, output_dir):
+    """Names the solution file of a puzzle the way run.sh does, after the
+    digits in the puzzle's file name.
+
+    Args:
+        puzzle_file: The name of the input file describing the puzzle.
+        output_dir: The directory solution files are written to.
+
+    Returns:
+        The path of the solution file.
+    """
+
+    digits = ''.join(c for c in os.path.basename(puzzle_file) if c.isdigit())
+
+    return os.path.join(output_dir, "solution{}.txt".format(digits))
+
+
+def get_stats_file(solution_file):
+    """Names the stats file that goes next to a solution file.
+
+    Args:
+        solution_file: The name of the solution file.
+
+    Returns:
+        The path of the stats file.
+    """
+
+    return os.path.splitext(solution_file)[0] + '.stats.json'
+
+
+def get_checkpoint_file(solution_file):
+    """Names the checkpoint file that goes next to a solution file.
+
+    Args:
+        solution_file: The name of the solution file.
+
+    Returns:
+        The path of the checkpoint file.
+    """
+
+    return os.path.splitext(solution_file)[0] + '.checkpoint'
+
+
+def find_puzzles(paths):
+    """Expands a list of puzzle files and directories into puzzle files.
+    Directories contribute every puzzle*.txt file directly inside them.
+
+    Args:
+        paths: The puzzle files and directories to solve.
+
+    Returns:
+        A list of puzzle file names, in the order they were given.
+    """
+
+    puzzles = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            puzzles += sorted(os.path.join(path, name) for name in os.listdir(path)
+                              if name.startswith('puzzle') and name.endswith('.txt'))
+        else:
+            puzzles.append(path)
+
+    return puzzles
+
+
+def on_timeout(signum, frame):
+    """Signal handler that aborts a puzzle that ran past its timeout."""
+
+    raise TimeoutError("timed out")
+
+
+def solve_file(puzzle_file, solution_file, timeout, stats, options):
+    """Solves a puzzle in a batch worker and writes its solution file. With a
+    deadline, every improved solution is written to it as soon as it's found.
+
+    Args:
+        puzzle_file: The name of the input file describing the puzzle.
+        solution_file: The name of the solution file to write.
+        timeout: Seconds the puzzle may run for, or None for no limit.
+        stats: Whether to dump search stats next to the solution file.
+        options: A dict of the search options, see solve.
+
+    Returns:
+        A tuple of the score reached and the wall-clock time taken.
+    """
+
+    start_time = default_timer()
+    options = dict(options, stats_file=get_stats_file(solution_file) if stats else None)
+
+    if options.get('checkpoint_interval') is not None or options.get('resume'):
+        options['checkpoint_file'] = get_checkpoint_file(solution_file)
+
+    if options.get('deadline') is not None:
+        options['best_file'] = solution_file
+
+    # the alarm interrupts the search itself, so the worker is free again
+    if timeout:
+        signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        solution, score = solve(puzzle_file, **options)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    write_solution(solution_file, solution)
+
+    return score, default_timer() - start_time
+
+
+def solve_packed(pack_file, i, timeout, options):
+    """Solves a puzzle of a puzzle pack in a batch worker. The pack stays
+    open in the worker, so its puzzles are read straight from the mapped file.
+
+    Args:
+        pack_file: The name of the puzzle pack.
+        i: The index of the puzzle in the pack.
+        timeout: Seconds the puzzle may run for, or None for no limit.
+        options: A dict of the search options, see search, and the engine.
+
+    Returns:
+        A tuple of the score reached, the swaps performed and the seconds it
+        took, or of None, the error and the seconds it took if it failed.
+    """
+
+    start_time = default_timer()
+    options = dict(options)
+    engine = options.pop('engine')
+
+    if (pack_file, engine) not in packs:
+        packs[pack_file, engine] = PuzzlePack(pack_file, engine)
+
+    # the alarm interrupts the search itself, so the worker is free again
+    if timeout:
+        signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    # a failure is returned rather than raised, so it doesn't stop the chunk
+    try:
+        tree = search(packs[pack_file, engine][i], **options)[0]
+    except Exception as e:
+        return None, "{}: {}".format(type(e).__name__, e), default_timer() - start_time
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return tree.max_node.state.score, tree.max_node.get_swaps(), default_timer() - start_time
+
+
+def batch_pack(pack_file, output_dir='.', timeout=None, jobs=None, **options):
+    """Solves every puzzle of a puzzle pack in a pool of worker processes,
+    writing their solutions to a solution pack named after it, in the order
+    of the puzzles. Workers are handed PACK_CHUNK_SIZE puzzles at a time, and
+    read them from the pack themselves. A puzzle that fails or times out gets
+    an empty solution and is reported without stopping the others.
+
+    Args:
+        pack_file: The name of the puzzle pack.
+        output_dir: The directory the solution pack is written to.
+        timeout: Seconds each puzzle may run for, or None for no limit.
+        jobs: The number of worker processes (default: one per core).
+        options: The search options for every puzzle, see search, and the
+            engine.
+
+    Returns:
+        The number of puzzles that failed.
+    """
+
+    name = os.path.splitext(os.path.basename(pack_file))[0] + SOLUTION_EXTENSION
+    solution_file = os.path.join(output_dir, name)
+    failed = 0
+    start_time = default_timer()
+
+    with PuzzlePack(pack_file) as pack:
+        count = len(pack)
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool, \
+            PackWriter(solution_file, SOLUTION_MAGIC) as writer:
+        results = pool.map(solve_packed, [pack_file] * count, range(count), [timeout] * count,
+                           [options] * count, chunksize=PACK_CHUNK_SIZE)
+
+        for i, (score, swaps, time) in enumerate(results):
+            if score is None:
+                failed += 1
+                writer.write_failure()
+                print("{}[{}]: {}".format(pack_file, i, swaps))
+            else:
+                writer.write_solution(score, swaps, time)
+
+    print("{} of {} puzzles of {} solved in {:.3f} seconds, solutions in {}".format(
+        count - failed, count, pack_file, default_timer() - start_time, solution_file))
+
+    return failed
+
+
+def batch(paths, output_dir='.', timeout=None, jobs=None, stats=False, **options):
+    """Solves many puzzles in a pool of worker processes, writing a solution
+    file for each and printing a summary table. A puzzle that fails or times
+    out is reported in the summary without stopping the others. Puzzle packs
+    are solved by batch_pack instead, into a solution pack each.
+
+    Args:
+        paths: The puzzle files and directories to solve.
+        output_dir: The directory solution files are written to.
+        timeout: Seconds each puzzle may run for, or None for no limit.
+        jobs: The number of worker processes (default: one per core).
+        stats: Whether to dump search stats next to each solution file.
+        options: The search options for every puzzle, see solve.
+
+    Returns:
+        The number of puzzles that failed.
+    """
+
+    failed = 0
+
+    for path in paths:
+        if path.endswith(PUZZLE_EXTENSION):
+            failed += batch_pack(path, output_dir, timeout, jobs, **options)
+
+    puzzles = find_puzzles([path for path in paths if not path.endswith(PUZZLE_EXTENSION)])
+    start_time = default_timer()
+
+    if not puzzles:
+        return failed
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(solve_file, puzzle_file, get_solution_file(puzzle_file, output_dir),
+                               timeout, stats, options)
+                   for puzzle_file in puzzles]
+
+        print("{:<30} {:>8} {:>10}  {}".format("puzzle", "score", "time", "status"))
+
+        for puzzle_file, future in zip(puzzles, futures):
+            try:
+                score, time = future.result()
+                print("{:<30} {:>8} {:>10.3f}  ok".format(puzzle_file, score, time))
+            except Exception as e:
+                failed += 1
+                print("{:<30} {:>8} {:>10}  {}: {}".format(puzzle_file, '-', '-',
+                                                          type(e).__name__, e))
+
+    print("{} of {} puzzles solved in {:.3f} seconds".format(
+        len(puzzles) - failed, len(puzzles), default_timer() - start_time))
+
+    return failed
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        main(sys.argv[1])
-    else:
-        print("Usage: {} puzzle_file".format(sys.argv[0]))
+    parser = argparse.ArgumentParser(description="Solve a puzzle using A* graph search.")
+    parser.add_argument('puzzle_files', nargs='+', metavar='puzzle_file',
+                        help="the input file describing the puzzle (in batch mode, "
+                             "any number of puzzle files, directories of them or puzzle "
+                             "packs, see packfile.py)")
+    parser.add_argument('--engine', choices=ENGINES, default='regex',
+                        help="the match detection engine to use (default: regex)")
+    parser.add_argument('--batch', action='store_true',
+                        help="solve every puzzle in parallel, writing a solution file for each")
+    parser.add_argument('--output-dir', default='.',
+                        help="the directory batch solution files are written to (default: .)")
+    parser.add_argument('--timeout', type=float,
+                        help="seconds each puzzle may run for in batch mode (default: no limit)")
+    parser.add_argument('--jobs', type=int,
+                        help="the number of worker processes in batch mode (default: one per core)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="the number of processes searching each puzzle, by splitting "
+                             "its search tree at the root (default: 1)")
+    parser.add_argument('--strategy', choices=STRATEGIES, default='astargs',
+                        help="the search strategy to use, ida_star keeping memory bounded, "
+                             "beam keeping time and memory bounded at the cost of the best "
+                             "score and external_bfts keeping breadth-first layers on disk "
+                             "(default: astargs)")
+    parser.add_argument('--cache-size', type=float, default=Tree.CACHE_SIZE / 2**20,
+                        help="megabytes of swap outcomes cached per search, 0 to disable "
+                             "(default: %(default)g)")
+    parser.add_argument('--stats', action='store_true',
+                        help="dump search counters and timers as JSON to "
+                             "solutionN.stats.json, next to the solution")
+    parser.add_argument('--deadline', type=float,
+                        help="seconds to search each puzzle for with anytime A*, keeping the "
+                             "best solution found when time runs out")
+    parser.add_argument('--best-file',
+                        help="a file to write each improved solution to as soon as anytime "
+                             "A* finds it (in batch mode, the solution files are used)")
+    parser.add_argument('--heuristic', choices=HEURISTICS, default='needed_gain',
+                        help="the heuristic astargs ranks nodes by (default: needed_gain)")
+    parser.add_argument('--checkpoint', type=float, metavar='SECONDS',
+                        help="snapshot the search every SECONDS to solutionN.checkpoint, next "
+                             "to the solution, so that it can be resumed")
+    parser.add_argument('--resume', action='store_true',
+                        help="resume the search from its solutionN.checkpoint, where there is "
+                             "one, getting the result an uninterrupted search would have")
+    parser.add_argument('--inexact', action='store_true',
+                        help="let ida_star prune nodes that couldn't reach the quota if no "
+                             "swap gained more than the most seen so far, which is faster "
+                             "but can miss solutions")
+    parser.add_argument('--lazy', action='store_true',
+                        help="let astargs create each child only once it reaches the front "
+                             "of the frontier, ranked until then by its swap's first clear, "
+                             "which is faster but can take more swaps")
+    parser.add_argument('--spill-size', type=float, default=Tree.SPILL_SIZE / 2**20,
+                        help="megabytes of states external_bfts holds in memory before "
+                             "spilling them to disk (default: %(default)g)")
+    parser.add_argument('--spill-dir',
+                        help="the directory external_bfts keeps its layer files in "
+                             "(default: the system's temporary directory)")
+    parser.add_argument('--beam-width', type=int, default=Tree.BEAM_WIDTH,
+                        help="the most nodes beam keeps at each depth (default: %(default)s)")
+    parser.add_argument('--beam-seed', type=int,
+                        help="keep a random sample of each depth's children, favouring higher "
+                             "scores, drawn with this seed (default: the highest scores)")
+    args = parser.parse_args()
+
+    if args.beam_width < 1:
+        parser.error("--beam-width must be at least 1")
+
+    if args.inexact and args.strategy != 'ida_star':
+        parser.error("--inexact only applies to ida_star")
+
+    if args.lazy and (args.strategy != 'astargs' or args.deadline is not None):
+        parser.error("--lazy only applies to astargs, without --deadline")
+
+    if args.checkpoint is not None and args.checkpoint <= 0:
+        parser.error("--checkpoint must be a positive number of seconds")
+
+    if args.workers > 1 and args.strategy != 'astargs':
+        parser.error("only astargs can be run with more than one worker")
+
+    if args.deadline is not None and (args.workers > 1 or args.strategy != 'astargs'):
+        parser.error("--deadline runs anytime A*, it can't be combined with --workers or "
+                     "--strategy")
+
+    if args.best_file is not None and args.deadline is None:
+        parser.error("--best-file only applies with --deadline")
+
+    if ((args.checkpoint is not None or args.resume) and
+            (args.strategy != 'astargs' or args.workers > 1 or args.deadline is not None)):
+        parser.error("only astargs can be checkpointed, on its own and without --deadline")
+
+    options = dict(engine=ENGINES[args.engine], workers=args.workers, strategy=args.strategy,
+                   cache_size=int(args.cache_size * 2**20), deadline=args.deadline,
+                   heuristic=HEURISTICS[args.heuristic], beam_width=args.beam_width,
+                   beam_seed=args.beam_seed, checkpoint_interval=args.checkpoint,
+                   resume=args.resume, spill_size=int(args.spill_size * 2**20),
+                   spill_dir=args.spill_dir, inexact=args.inexact, lazy=args.lazy)
+
+    packed = any(path.endswith(PUZZLE_EXTENSION) for path in args.puzzle_files)
+
+    if packed and not args.batch:
+        parser.error("puzzle packs can only be solved with --batch")
+
+    if packed and (args.stats or args.checkpoint is not None or args.resume):
+        parser.error("puzzle packs can't be solved with --stats, --checkpoint or --resume")
+
+    if args.batch:
+        sys.exit(1 if batch(args.puzzle_files, args.output_dir, args.timeout, args.jobs,
+                            args.stats, **options) else 0)
+    elif len(args.puzzle_files) > 1:
+        parser.error("only one puzzle file can be solved without --batch")
+
+    main(args.puzzle_files[0], args.stats, best_file=args.best_file, **options)
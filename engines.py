@@ -0,0 +1,18 @@
+# local imports
+from bitboard import BitboardPuzzle
+from lookup import LookupPuzzle
+from puzzle import Puzzle
+
+try:
+    from numpyboard import NumpyPuzzle
+except ImportError:
+    # numpy is optional, without it the numpy engine is the pure python one
+    NumpyPuzzle = Puzzle
+
+# interchangeable match detection engines, by the name the driver uses
+ENGINES = {
+    'regex': Puzzle,
+    'bitboard': BitboardPuzzle,
+    'lookup': LookupPuzzle,
+    'numpy': NumpyPuzzle,
+}
@@ -0,0 +1,59 @@
+import math
+
+
+def score_cost(node):
+    """The original A* key: the score still needed, times the swaps made so
+    far. It gives the root (and any node that reached the quota) priority 0,
+    and estimates nothing about the swaps still needed.
+
+    Args:
+        node: The node to rank.
+
+    Returns:
+        The priority of the node, lowest first.
+    """
+
+    return (node.state.quota-node.state.score)*node.cost
+
+
+def needed_gain(node):
+    """Ranks a node by the score each of its remaining swaps would still need
+    to gain on average, once the best immediate clear of any of its valid
+    swaps is counted. The best clear comes from the node's own move
+    generation, which finds it along with the valid swaps and keeps both for
+    when the node is expanded, so it's only computed once per node.
+
+    This isn't admissible: a swap's cascade can gain far more than its
+    immediate clear, and a low rate doesn't mean few swaps. It steers the
+    search greedily towards boards that can still make the quota in the swaps
+    left, which reaches the quota with many fewer expansions, sometimes with
+    more swaps than needed.
+
+    Args:
+        node: The node to rank.
+
+    Returns:
+        The priority of the node, lowest first. Goals come first, and nodes
+        with no swap left to make come last.
+    """
+
+    state = node.state
+    needed = state.quota - state.score
+
+    if needed <= 0:
+        return -math.inf
+
+    left = state.max_swaps - node.cost
+    best = state.get_best_gain() if left > 0 else 0
+
+    if not best:
+        return math.inf
+
+    return (needed - best) / left
+
+
+# astargs heuristics, by the name the driver uses
+HEURISTICS = {
+    'needed_gain': needed_gain,
+    'score_cost': score_cost,
+}
@@ -0,0 +1,342 @@
+import heapq
+import os
+import struct
+import sys
+import tempfile
+from functools import partial
+from itertools import groupby
+
+
+class LayerStore:
+    """Represents the depth layers of a breadth-first search kept on disk, so
+    that layers much larger than memory can be searched.
+
+    Each state of a layer is a fixed-size record: its board, its score, the
+    index of its parent in the layer before and the index of its swap in the
+    swap table. Boards are packed two cells to a byte where every device
+    number fits in four bits (fewer than 16 device types), and take a byte per
+    cell otherwise. Swap indices take two bytes, or four on boards with more
+    swaps than that holds. The score is stored inverted, so that sorting
+    records as plain bytes orders them by board and then by score, highest
+    first.
+
+    Records of the layer being built are collected in a bounded buffer, which
+    is sorted and spilled to a run file whenever it fills. Finishing the layer
+    merges its runs, keeping the best record of each board, and drops any
+    record a board of an earlier layer dominates (at least its score with fewer
+    swaps), by merging against a sorted file of the best score seen for every
+    board so far. Duplicates are only detected then, not as states are made,
+    but the search keeps exactly the states DominanceTable would. The finished
+    layer is a single sorted file, which is streamed back to expand the next
+    layer, and read at random to rebuild the swaps of a path."""
+
+    # largest score a record holds, which is how its score is inverted
+    MAX_SCORE = 0xFFFFFFFF
+
+    # device types past which boards can't be packed two cells to a byte
+    PACKED_DEVICE_TYPES = 15
+
+    # swaps past which swap indices don't fit in two bytes
+    SHORT_ACTIONS = 0xFFFF
+
+    # most run files merged at once, past which runs are merged in passes
+    MERGE_FANIN = 64
+
+    # bytes read or written at a time when streaming a file
+    IO_BUFFER = 1 << 16
+
+    def __init__(self, cells, num_device_types, actions, buffer_size, directory=None):
+        """Initializes an empty LayerStore instance.
+
+        Args:
+            cells: The number of cells of each board, pool included.
+            num_device_types: The number of device types.
+            actions: The number of swaps in the swap table.
+            buffer_size: The most bytes of records held in memory at once.
+            directory: Where the layer files are kept, None for the system's
+                temporary directory. They are removed by close().
+        """
+
+        self.cells = cells
+        self.packed = num_device_types <= LayerStore.PACKED_DEVICE_TYPES
+
+        board_size = (cells + 1) // 2 if self.packed else cells
+        action_format = 'H' if actions <= LayerStore.SHORT_ACTIONS else 'I'
+
+        # board, inverted score, parent index and swap index
+        self.record = struct.Struct('>{}sII{}'.format(board_size, action_format))
+        self.seen_record = struct.Struct('>{}sI'.format(board_size))
+
+        # a record as a bytes object costs its own overhead too
+        self.buffer_records = max(1, buffer_size // sys.getsizeof(bytes(self.record.size)))
+
+        self.directory = tempfile.mkdtemp(prefix='layers-', dir=directory)
+        self.layers = []        # finished layer files, by depth
+        self.counts = []        # records in each finished layer
+        self.buffer = []        # records of the layer being built
+        self.runs = []          # run files spilled for the layer being built
+        self.seen = None        # best score of every board seen, as a file
+        self.files = 0          # files made so far, to name them uniquely
+
+        self.spilled = 0        # runs spilled, over every layer
+        self.dominated = 0      # records dropped on finishing a layer
+
+    def pack(self, board):
+        """Packs a board two cells to a byte, if the store packs boards.
+
+        Args:
+            board: A bytes-like object of device numbers.
+
+        Returns:
+            The board as stored.
+        """
+
+        if not self.packed:
+            return bytes(board)
+
+        if len(board) % 2:
+            board = bytes(board) + bytes(1)
+
+        return bytes(map(int.__or__, board[0::2].translate(SHIFT), board[1::2]))
+
+    def unpack(self, packed):
+        """Unpacks a board packed by pack.
+
+        Args:
+            packed: The board as stored.
+
+        Returns:
+            A bytearray of the board's device numbers.
+        """
+
+        if not self.packed:
+            return bytearray(packed)
+
+        board = bytearray(len(packed) * 2)
+        board[0::2] = packed.translate(HIGH)
+        board[1::2] = packed.translate(LOW)
+
+        del board[self.cells:]
+
+        return board
+
+    def add(self, board, score, parent, action):
+        """Adds a state to the layer being built.
+
+        Args:
+            board: The state's board.
+            score: The state's score.
+            parent: The index of its parent in the last finished layer.
+            action: The index of the swap that led to it in the swap table.
+        """
+
+        self.buffer.append(self.record.pack(self.pack(board), LayerStore.MAX_SCORE - score,
+                                            parent, action))
+
+        if len(self.buffer) >= self.buffer_records:
+            self.spill()
+
+    def spill(self):
+        """Sorts the buffer and writes it out as a run of the layer being
+        built, emptying it."""
+
+        if not self.buffer:
+            return
+
+        self.buffer.sort()
+
+        path = self.new_file('run')
+
+        with open(path, 'wb', buffering=LayerStore.IO_BUFFER) as f:
+            f.writelines(self.buffer)
+
+        self.runs.append(path)
+        self.buffer = []
+        self.spilled += 1
+
+    def finish(self):
+        """Finishes the layer being built: merges its runs into one sorted
+        file, dropping every record but the best of each board and any record
+        an earlier layer dominates.
+
+        Returns:
+            The number of records in the finished layer.
+        """
+
+        # a layer that fits in the buffer never touches the disk as runs
+        if self.runs:
+            self.spill()
+            runs = self.merge_runs(self.runs)
+        else:
+            self.buffer.sort()
+            runs = [iter(self.buffer)]
+
+        size = self.seen_record.size
+        layer = self.new_file('layer')
+        seen = self.new_file('seen')
+        count = 0
+
+        old_seen = self.read_file(self.seen, size) if self.seen is not None else iter(())
+        best = next(old_seen, None)
+
+        with open(layer, 'wb', buffering=LayerStore.IO_BUFFER) as layer_file, \
+                open(seen, 'wb', buffering=LayerStore.IO_BUFFER) as seen_file:
+            # the first record of each board has its highest score
+            for board, records in groupby(heapq.merge(*runs), key=lambda record: record[:size-4]):
+                record = next(records)
+                self.dominated += sum(1 for other in records)
+
+                # boards seen before this one are carried over as they were
+                while best is not None and best[:size-4] < board:
+                    seen_file.write(best)
+                    best = next(old_seen, None)
+
+                # an earlier layer with at least this score dominates it, as
+                # inverted scores compare the other way round
+                if best is not None and best[:size-4] == board:
+                    if best <= record[:size]:
+                        self.dominated += 1
+                        continue
+
+                    best = next(old_seen, None)
+
+                layer_file.write(record)
+                seen_file.write(record[:size])
+                count += 1
+
+            while best is not None:
+                seen_file.write(best)
+                best = next(old_seen, None)
+
+        for path in self.runs + ([self.seen] if self.seen is not None else []):
+            os.remove(path)
+
+        self.layers.append(layer)
+        self.counts.append(count)
+        self.buffer = []
+        self.runs = []
+        self.seen = seen
+
+        return count
+
+    def merge_runs(self, runs):
+        """Merges run files in passes of MERGE_FANIN, until few enough are left
+        to be merged in one go.
+
+        Args:
+            runs: The paths of the run files, which are replaced as they're
+                merged.
+
+        Returns:
+            An iterator over the records of each remaining run.
+        """
+
+        while len(runs) > LayerStore.MERGE_FANIN:
+            merged = []
+
+            for i in range(0, len(runs), LayerStore.MERGE_FANIN):
+                group = runs[i:i + LayerStore.MERGE_FANIN]
+                path = self.new_file('run')
+
+                with open(path, 'wb', buffering=LayerStore.IO_BUFFER) as f:
+                    f.writelines(heapq.merge(*[self.read_file(run, self.record.size)
+                                               for run in group]))
+
+                for run in group:
+                    os.remove(run)
+
+                merged.append(path)
+
+            runs[:] = merged
+
+        return [self.read_file(run, self.record.size) for run in runs]
+
+    def read(self, depth):
+        """Streams the states of a finished layer, in the order they're stored.
+
+        Args:
+            depth: The depth of the layer.
+
+        Yields:
+            A (board, score) tuple for each state, its index in the layer being
+            its position in the stream.
+        """
+
+        for record in self.read_file(self.layers[depth], self.record.size):
+            board, score, parent, action = self.record.unpack(record)
+            yield self.unpack(board), LayerStore.MAX_SCORE - score
+
+    def get_actions(self, depth, index):
+        """Rebuilds the swaps that lead to a state of a finished layer, by
+        reading back its ancestors, one per layer.
+
+        Args:
+            depth: The depth of the state's layer.
+            index: The index of the state in its layer.
+
+        Returns:
+            A list of swap table indices, from the first swap made to the
+            state's own.
+        """
+
+        actions = []
+
+        while depth > 0:
+            with open(self.layers[depth], 'rb') as f:
+                f.seek(index * self.record.size)
+                board, score, index, action = self.record.unpack(f.read(self.record.size))
+
+            actions.append(action)
+            depth -= 1
+
+        actions.reverse()
+
+        return actions
+
+    def new_file(self, kind):
+        """Names a new file of the store.
+
+        Args:
+            kind: What the file holds, 'run', 'layer' or 'seen'.
+
+        Returns:
+            The path of the file.
+        """
+
+        self.files += 1
+
+        return os.path.join(self.directory, '{}{}.bin'.format(kind, self.files))
+
+    def read_file(self, path, size):
+        """Streams the fixed-size records of a file.
+
+        Args:
+            path: The path of the file.
+            size: The size of each record.
+
+        Yields:
+            Each record, as bytes.
+        """
+
+        with open(path, 'rb', buffering=LayerStore.IO_BUFFER) as f:
+            yield from iter(partial(f.read, size), b'')
+
+    def close(self):
+        """Removes every file of the store."""
+
+        for path in self.layers + self.runs + ([self.seen] if self.seen is not None else []):
+            if os.path.exists(path):
+                os.remove(path)
+
+        os.rmdir(self.directory)
+
+        self.layers = []
+        self.runs = []
+        self.seen = None
+
+
+# translations of a cell to the high nibble of a byte, and of a packed byte
+# back to its high and low cells
+SHIFT = bytes((i << 4) & 0xFF for i in range(256))
+HIGH = bytes(i >> 4 for i in range(256))
+LOW = bytes(i & 0x0F for i in range(256))
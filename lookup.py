@@ -0,0 +1,229 @@
+import itertools
+import os
+from operator import itemgetter, mul
+
+# local imports
+from puzzle import Puzzle
+
+
+class LookupPuzzle(Puzzle):
+    """A puzzle that tests candidate swaps with precomputed lookup tables
+    instead of scanning whole rows and columns.
+
+    The board has no matches when swaps are tested, so any series a swap makes
+    runs through a swapped device, and can't reach more than two cells past
+    it. Each line Puzzle.get_matches scans therefore only depends on a window
+    of cells around the swap: six along the line the devices share (two each
+    side of the pair) and five across it (two each side of each device). A
+    window is encoded as an integer in base num_device_types+1, with empty
+    cells, pool cells and cells off the board all counting as 0, which never
+    matches. A table per window size then maps every encoding to the length of
+    the window's first series, so testing a swap takes one table lookup per
+    line. Clear counts are identical to the ones Puzzle finds."""
+
+    __slots__ = ()
+
+    # directory lookup tables are cached in between runs
+    CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'puzzle-lookup')
+
+    # most entries a table may have, past which swaps are tested by Puzzle
+    MAX_TABLE_SIZE = 1 << 24
+
+    # lookup tables per number of device types, None where they'd be too big
+    tables = {}
+
+    # window getters of every swap, per set of board dimensions
+    neighborhoods = {}
+
+    @staticmethod
+    def get_series_length(window):
+        """Finds the length of the first series of three or more (non-empty)
+        devices in a window, the way Puzzle.DEVICE_REGEX would.
+
+        Args:
+            window: A sequence of device numbers.
+
+        Returns:
+            The length of the series, 0 if there isn't one.
+        """
+
+        start = 0
+
+        for i in range(1, len(window) + 1):
+            # a run ends at the end of the window or where the device changes
+            if i == len(window) or window[i] != window[start]:
+                if i - start >= 3 and window[start] != Puzzle.EMPTY:
+                    return i - start
+
+                start = i
+
+        return 0
+
+    def get_tables(self):
+        """Returns the lookup tables for this puzzle's number of device types,
+        loading them from CACHE_DIR or building (and caching) them on first use.
+
+        Returns:
+            A tuple of the 6-cell and 5-cell window tables, as bytes indexed by
+            window encoding, or None if they'd be bigger than MAX_TABLE_SIZE.
+        """
+
+        base = self.num_device_types + 1
+
+        if self.num_device_types not in LookupPuzzle.tables:
+            sizes = (base**6, base**5)
+            tables = None
+
+            if sizes[0] <= LookupPuzzle.MAX_TABLE_SIZE:
+                tables = self.load_tables(sizes)
+
+                if tables is None:
+                    tables = tuple(bytes(map(self.get_series_length,
+                                             itertools.product(range(base), repeat=cells)))
+                                   for cells in (6, 5))
+                    self.save_tables(tables)
+
+            LookupPuzzle.tables[self.num_device_types] = tables
+
+        return LookupPuzzle.tables[self.num_device_types]
+
+    def get_cache_file(self):
+        """Returns the name of the file this puzzle's lookup tables are cached in.
+
+        Returns:
+            The path of the cache file.
+        """
+
+        return os.path.join(LookupPuzzle.CACHE_DIR, 'lookup{}.bin'.format(self.num_device_types))
+
+    def load_tables(self, sizes):
+        """Loads the lookup tables for this puzzle's number of device types
+        from the cache.
+
+        Args:
+            sizes: The number of entries of each table.
+
+        Returns:
+            A tuple of the tables, or None if they aren't cached (or the cache
+            file doesn't hold tables of the right sizes).
+        """
+
+        try:
+            with open(self.get_cache_file(), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        if len(data) != sum(sizes):
+            return None
+
+        return data[:sizes[0]], data[sizes[0]:]
+
+    def save_tables(self, tables):
+        """Caches lookup tables in one step, so that a run reading them never
+        sees a partly written file. A cache that can't be written is skipped,
+        the tables are just built again next run.
+
+        Args:
+            tables: The tables to cache.
+        """
+
+        cache_file = self.get_cache_file()
+
+        try:
+            os.makedirs(LookupPuzzle.CACHE_DIR, exist_ok=True)
+
+            with open(cache_file + '.tmp', 'wb') as f:
+                f.write(b''.join(tables))
+
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError:
+            pass
+
+    def get_neighborhoods(self):
+        """Returns the window getters of every swap for this puzzle's
+        dimensions, building them on first use.
+
+        Each getter reads its window from the board with a sentinel 0 appended,
+        in the order the devices sit after the swap, so the swap itself never
+        has to be made. Cells off the board or in the pool are read from the
+        sentinel.
+
+        Returns:
+            A list with a tuple of three getters for every swap in the swap
+            table: the 6-cell window along the swap, then the 5-cell windows
+            across it at the first and the second device.
+        """
+
+        dimensions = (self.width, self.height, self.pool_height)
+
+        if dimensions not in LookupPuzzle.neighborhoods:
+            sentinel = self.width * self.height
+
+            def cell(x, y):
+                if 0 <= x < self.width and self.pool_height <= y < self.height:
+                    return y*self.width + x
+
+                return sentinel
+
+            neighborhoods = []
+
+            for (x1, y1), (x2, y2) in self.get_swap_table()[0]:
+                i1, i2 = cell(x1, y1), cell(x2, y2)
+
+                # horizontal swap, the row along it and the columns across it
+                if y1 == y2:
+                    line = (cell(x1-2, y1), cell(x1-1, y1), i2, i1, cell(x2+1, y1), cell(x2+2, y1))
+                    across1 = (cell(x1, y1-2), cell(x1, y1-1), i2, cell(x1, y1+1), cell(x1, y1+2))
+                    across2 = (cell(x2, y2-2), cell(x2, y2-1), i1, cell(x2, y2+1), cell(x2, y2+2))
+                # vertical swap, the column along it and the rows across it
+                else:
+                    line = (cell(x1, y1-2), cell(x1, y1-1), i2, i1, cell(x1, y2+1), cell(x1, y2+2))
+                    across1 = (cell(x1-2, y1), cell(x1-1, y1), i2, cell(x1+1, y1), cell(x1+2, y1))
+                    across2 = (cell(x2-2, y2), cell(x2-1, y2), i1, cell(x2+1, y2), cell(x2+2, y2))
+
+                neighborhoods.append((itemgetter(*line), itemgetter(*across1),
+                                      itemgetter(*across2)))
+
+            LookupPuzzle.neighborhoods[dimensions] = neighborhoods
+
+        return LookupPuzzle.neighborhoods[dimensions]
+
+    def test_swaps(self, indices):
+        """Look up which swaps would result in a match. See Puzzle.test_swaps.
+
+        Args:
+            indices: The indices of the swaps to test in the swap table.
+
+        Returns:
+            A dict mapping the index of each swap that results in at least one
+            match to the number of devices that match.
+        """
+
+        tables = self.get_tables()
+
+        if tables is None:
+            return super().test_swaps(indices)
+
+        line_table, across_table = tables
+        neighborhoods = self.get_neighborhoods()
+        base = self.num_device_types + 1
+
+        # place values of each cell of a window's encoding, first cell highest
+        line_weights = [base**power for power in range(5, -1, -1)]
+        across_weights = line_weights[1:]
+
+        cells = self.board + bytes(1)
+        valid = {}
+
+        for k in indices:
+            line, across1, across2 = neighborhoods[k]
+
+            cleared = (line_table[sum(map(mul, line(cells), line_weights))] +
+                       across_table[sum(map(mul, across1(cells), across_weights))] +
+                       across_table[sum(map(mul, across2(cells), across_weights))])
+
+            if cleared:
+                valid[k] = cleared
+
+        return valid
@@ -2,6 +2,8 @@ class Node:
     """A container object for our state, action, parent and path cost. This
     represents an individual node of our tree."""
 
+    __slots__ = ('state', 'action', 'parent', 'cost')
+
     def __init__(self, state, action=None, parent=None, cost=0):
         """Initializes a node instance.
 
@@ -22,12 +24,84 @@ class Node:
         self.cost = cost
 
     def perform_action(self):
-        """Perform a swap based on the value of self.action. Also append to
-        list of swaps and add to path cost."""
+        """Perform a swap based on the value of self.action. Also add to path
+        cost. The swap itself is only recorded as the action, see get_swaps."""
 
         self.state.swap(self.action[0], self.action[1])
-        self.state.swaps.append((self.action[0], self.action[1]))
         self.cost += 1
 
+    def get_swaps(self):
+        """Rebuild the swaps performed to reach this node by walking back
+        through the actions of its parents, so no node stores its history.
+
+        Returns:
+            A list of swaps, from the first one performed to this node's own.
+        """
+
+        swaps = []
+        node = self
+
+        while node.action is not None:
+            swaps.append(node.action)
+            node = node.parent
+
+        swaps.reverse()
+
+        return swaps
+
     def __eq__(self, other):
         return self.state == other.state
+
+    def __hash__(self):
+        return hash(self.state)
+
+
+class Successor:
+    """A child of a node that may not have been created yet, standing in for
+    it in a lazy tree's frontier. Until then it's its own state, scored as the
+    parent plus its swap's first clear."""
+
+    __slots__ = ('parent', 'action', 'cleared', 'node')
+
+    def __init__(self, parent, action, cleared):
+        """Initializes a successor instance.
+
+        Args:
+            parent: The node the swap is made on.
+            action: The coordinates of the devices to be swapped.
+            cleared: The devices the swap's first match clears.
+        """
+
+        self.parent = parent
+        self.action = action
+        self.cleared = cleared
+        self.node = None    # the child, once it's been created
+
+    @property
+    def state(self):
+        return self if self.node is None else self.node.state
+
+    @property
+    def cost(self):
+        return self.parent.cost + 1
+
+    @property
+    def score(self):
+        return self.parent.state.score + self.cleared
+
+    @property
+    def quota(self):
+        return self.parent.state.quota
+
+    @property
+    def max_swaps(self):
+        return self.parent.state.max_swaps
+
+    def get_best_gain(self):
+        return self.parent.state.get_best_gain()
+
+    def __eq__(self, other):
+        return self.action == other.action and self.parent.state == other.parent.state
+
+    def __hash__(self):
+        return hash((self.parent.state, self.action))
@@ -0,0 +1,108 @@
+import numpy as np
+
+# local imports
+from puzzle import Puzzle
+
+
+class NumpyPuzzle(Puzzle):
+    """A puzzle that tests candidate swaps in batches with NumPy.
+
+    Rather than swapping, matching and swapping back one candidate at a time,
+    every candidate's swapped board is built at once as a stacked array, and
+    the lines each swap checks are scanned for series with vectorized
+    comparisons. Matches are identical to the ones Puzzle finds, including only
+    counting the leftmost (or topmost) series in each row (or column)."""
+
+    __slots__ = ()
+
+    # most cells stacked into one batch, to keep memory bounded on big boards
+    BATCH_CELLS = 1 << 24
+
+    # swap coordinates as arrays, per set of board dimensions
+    coords = {}
+
+    def get_coords(self):
+        """Returns the swap table of this puzzle's dimensions as arrays.
+
+        Returns:
+            The x1, y1, x2 and y2 coordinates of every swap, as a single
+            integer array with one row per swap.
+        """
+
+        dimensions = (self.width, self.height, self.pool_height)
+
+        if dimensions not in NumpyPuzzle.coords:
+            swaps = self.get_swap_table()[0]
+
+            NumpyPuzzle.coords[dimensions] = np.array(
+                [dev1 + dev2 for dev1, dev2 in swaps], dtype=np.intp).reshape(-1, 4)
+
+        return NumpyPuzzle.coords[dimensions]
+
+    @staticmethod
+    def get_series_lengths(lines):
+        """Finds the length of the first series of three or more (non-empty)
+        devices in every line of a batch.
+
+        Args:
+            lines: A 2D array with one line of devices per row.
+
+        Returns:
+            An array of series lengths, 0 where a line has no series.
+        """
+
+        if lines.shape[1] < 3:
+            return np.zeros(len(lines), dtype=np.intp)
+
+        # same[:, j] is set where device j+1 repeats device j
+        same = lines[:, 1:] == lines[:, :-1]
+        starts = same[:, 1:] & same[:, :-1] & (lines[:, 2:] != Puzzle.EMPTY)
+
+        found = starts.any(axis=1)
+        start = starts.argmax(axis=1)
+
+        # the series runs until the first device after its start that differs
+        breaks = ~same & (np.arange(same.shape[1]) >= start[:, None])
+        end = np.where(breaks.any(axis=1), breaks.argmax(axis=1), same.shape[1])
+
+        return np.where(found, end - start + 1, 0)
+
+    def test_swaps(self, indices):
+        """Simulate swaps in batches and return only those that would result in
+        a match. The board itself is never touched.
+
+        Args:
+            indices: The indices of the swaps to test in the swap table.
+
+        Returns:
+            A dict mapping the index of each swap that results in at least one
+            match to the number of devices that match.
+        """
+
+        indices = np.fromiter(indices, dtype=np.intp)
+        board = np.frombuffer(bytes(self.board), dtype=np.uint8).reshape(self.height, self.width)
+        batch = max(1, NumpyPuzzle.BATCH_CELLS // board.size)
+        valid = {}
+
+        for first in range(0, len(indices), batch):
+            chunk = indices[first:first+batch]
+            x1, y1, x2, y2 = self.get_coords()[chunk].T
+            n = np.arange(len(chunk))
+
+            # stack a copy of the board per swap, then perform every swap
+            boards = np.repeat(board[None], len(chunk), axis=0)
+            boards[n, y1, x1] = board[y2, x2]
+            boards[n, y2, x2] = board[y1, x1]
+
+            # a swap checks the row of dev1 and the column of dev1, plus the
+            # column of dev2 if it's horizontal or the row of dev2 if vertical
+            cleared = (self.get_series_lengths(boards[n, y1]) +
+                       self.get_series_lengths(boards[n, self.pool_height:, x1]) +
+                       np.where(y1 == y2,
+                                self.get_series_lengths(boards[n, self.pool_height:, x2]),
+                                self.get_series_lengths(boards[n, y2])))
+
+            for k, count in zip(chunk[cleared > 0].tolist(), cleared[cleared > 0].tolist()):
+                valid[k] = count
+
+        return valid
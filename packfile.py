@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+import argparse
+import mmap
+import os
+import struct
+
+# local imports
+from puzzle import Puzzle
+
+# what each kind of pack file holds, by the magic it starts with
+PUZZLE_MAGIC = b'PZLP'
+SOLUTION_MAGIC = b'PZLS'
+
+# file name extensions of puzzle and solution packs
+PUZZLE_EXTENSION = '.pzp'
+SOLUTION_EXTENSION = '.pzs'
+
+# version of the pack format, which must match to read a pack
+VERSION = 2
+
+# magic, version, number of records and offset of the index
+HEADER = struct.Struct('<4sHxxIQ')
+
+# offset of each record in the index, one more than there are records, so a
+# record ends where the next one starts
+OFFSET = struct.Struct('<Q')
+
+# quota, max swaps, device types, width, height, pool height and bonus rules,
+# followed by the board, one byte per cell
+PUZZLE = struct.Struct('<7I')
+
+# score, seconds taken and number of swaps, followed by the swaps, four
+# unsigned ints (x1, y1, x2, y2) each, as wide as the puzzle's dimensions
+SOLUTION = struct.Struct('<IdI')
+SWAP = struct.Struct('<4I')
+
+
+class PackWriter:
+    """Writes the records of a pack file one at a time, so a pack of any size
+    is written without holding it in memory. Records are written as they
+    come, and the index of their offsets once the pack is closed.
+
+    A pack is a header, the records back to back, then the index, so that any
+    record can be read straight from its offset without reading the others."""
+
+    def __init__(self, path, magic):
+        """Initializes a PackWriter instance, creating the file.
+
+        Args:
+            path: The name of the pack file.
+            magic: What the pack holds, PUZZLE_MAGIC or SOLUTION_MAGIC.
+        """
+
+        self.path = path
+        self.magic = magic
+        self.offsets = []
+
+        # the pack only replaces an existing file once it's complete
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(bytes(HEADER.size))
+
+    def write(self, record):
+        """Appends a record to the pack.
+
+        Args:
+            record: The record, as bytes.
+        """
+
+        self.offsets.append(self.file.tell())
+        self.file.write(record)
+
+    def write_puzzle(self, puzzle):
+        """Appends a puzzle to the pack.
+
+        Args:
+            puzzle: The Puzzle instance, as parsed, before any search.
+        """
+
+        self.write(PUZZLE.pack(puzzle.quota, puzzle.max_swaps, puzzle.num_device_types,
+                               puzzle.width, puzzle.height, puzzle.pool_height,
+                               puzzle.bonus_rules) + puzzle.board)
+
+    def write_solution(self, score, swaps, time):
+        """Appends a solution to the pack.
+
+        Args:
+            score: The score reached.
+            swaps: The swaps performed, as pairs of device locations.
+            time: The seconds it took.
+        """
+
+        self.write(SOLUTION.pack(score, time, len(swaps)) +
+                   b''.join(SWAP.pack(*dev1, *dev2) for dev1, dev2 in swaps))
+
+    def write_failure(self):
+        """Appends an empty record to a solution pack, for a puzzle that
+        couldn't be solved, so that solutions keep the indices of their
+        puzzles."""
+
+        self.write(b'')
+
+    def close(self):
+        """Writes the index and the header, then moves the pack in place."""
+
+        index = self.file.tell()
+
+        self.file.write(b''.join(OFFSET.pack(offset) for offset in self.offsets + [index]))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(self.magic, VERSION, len(self.offsets), index))
+        self.file.close()
+
+        os.replace(self.path + '.tmp', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.path + '.tmp')
+
+
+class Pack:
+    """Reads the records of a pack file. The file is memory-mapped, so
+    opening a pack reads nothing but its header, and each record is only read
+    (by the operating system, a page at a time) once it's asked for. Processes
+    reading the same pack share its pages."""
+
+    def __init__(self, path, magic):
+        """Initializes a Pack instance, mapping the file.
+
+        Args:
+            path: The name of the pack file.
+            magic: What the pack must hold, PUZZLE_MAGIC or SOLUTION_MAGIC.
+
+        Raises:
+            ValueError: If the file isn't a pack of the right kind or version.
+        """
+
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < HEADER.size:
+            raise ValueError("{} isn't a pack file".format(path))
+
+        file_magic, version, self.count, self.index = HEADER.unpack_from(self.map)
+
+        if file_magic != magic:
+            raise ValueError("{} isn't a {} pack".format(
+                path, 'puzzle' if magic == PUZZLE_MAGIC else 'solution'))
+
+        if version != VERSION:
+            raise ValueError("{} is from another version of the solver".format(path))
+
+    def get_record(self, i):
+        """Returns a record of the pack.
+
+        Args:
+            i: The index of the record.
+
+        Returns:
+            A memoryview of the record, within the mapped file.
+
+        Raises:
+            IndexError: If there's no such record.
+        """
+
+        if not 0 <= i < self.count:
+            raise IndexError("{} has no record {}".format(self.path, i))
+
+        start, = OFFSET.unpack_from(self.map, self.index + i*OFFSET.size)
+        end, = OFFSET.unpack_from(self.map, self.index + (i+1)*OFFSET.size)
+
+        return memoryview(self.map)[start:end]
+
+    def __len__(self):
+        """Overload __len__ to return the number of records.
+
+        Returns:
+            The number of records in the pack.
+        """
+
+        return self.count
+
+    def __iter__(self):
+        """Overload __iter__ to yield every record in turn, each only read as
+        it's reached."""
+
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        """Unmaps the file. Records already read must not be used after."""
+
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PuzzlePack(Pack):
+    """Reads the puzzles of a puzzle pack, as Puzzle instances of an engine,
+    straight from their bytes."""
+
+    def __init__(self, path, engine=Puzzle):
+        """Initializes a PuzzlePack instance, mapping the file.
+
+        Args:
+            path: The name of the puzzle pack.
+            engine: The Puzzle class puzzles are made with.
+
+        Raises:
+            ValueError: If the file isn't a puzzle pack of this version.
+        """
+
+        super().__init__(path, PUZZLE_MAGIC)
+        self.engine = engine
+
+    def __getitem__(self, i):
+        """Overload __getitem__ to make a puzzle of the pack.
+
+        Args:
+            i: The index of the puzzle.
+
+        Returns:
+            A new Puzzle instance of the pack's engine.
+
+        Raises:
+            IndexError: If there's no such puzzle.
+            ValueError: If the puzzle's board doesn't match its dimensions.
+        """
+
+        record = self.get_record(i)
+
+        return self.engine(*PUZZLE.unpack_from(record), record[PUZZLE.size:])
+
+    def get_text(self, i):
+        """Rebuilds the text of a puzzle file, as driver.solve_puzzle puts at
+        the top of its solution.
+
+        Args:
+            i: The index of the puzzle.
+
+        Returns:
+            The contents of the puzzle's file.
+        """
+
+        record = self.get_record(i)
+        parameters = PUZZLE.unpack_from(record)
+        board, width = record[PUZZLE.size:], parameters[3]
+
+        return '\n'.join([str(value) for value in parameters] +
+                         [' '.join(str(device) for device in board[y:y+width])
+                          for y in range(0, len(board), width)])
+
+
+class SolutionPack(Pack):
+    """Reads the solutions of a solution pack."""
+
+    def __init__(self, path):
+        """Initializes a SolutionPack instance, mapping the file.
+
+        Args:
+            path: The name of the solution pack.
+
+        Raises:
+            ValueError: If the file isn't a solution pack of this version.
+        """
+
+        super().__init__(path, SOLUTION_MAGIC)
+
+    def __getitem__(self, i):
+        """Overload __getitem__ to read a solution of the pack.
+
+        Args:
+            i: The index of the solution, which is that of its puzzle.
+
+        Returns:
+            A tuple of the score reached, the swaps performed (as pairs of
+            device locations) and the seconds it took, or None if the puzzle
+            couldn't be solved.
+
+        Raises:
+            IndexError: If there's no such solution.
+        """
+
+        record = self.get_record(i)
+
+        if not record:
+            return None
+
+        score, time, count = SOLUTION.unpack_from(record)
+        swaps = [((x1, y1), (x2, y2))
+                 for x1, y1, x2, y2 in SWAP.iter_unpack(record[SOLUTION.size:])]
+
+        return score, swaps, time
+
+
+def pack_puzzles(puzzle_files, pack_file):
+    """Converts puzzle files to a puzzle pack, in the order they're given.
+
+    Args:
+        puzzle_files: The names of the input files describing the puzzles.
+        pack_file: The name of the puzzle pack to write.
+
+    Raises:
+        TypeError, ValueError: If a puzzle is malformed.
+    """
+
+    with PackWriter(pack_file, PUZZLE_MAGIC) as writer:
+        for puzzle_file in puzzle_files:
+            with open(puzzle_file) as f:
+                lines = f.read().splitlines()
+
+            writer.write_puzzle(Puzzle(*lines[:7], lines[7:]))
+
+
+def unpack_solutions(pack_file, solution_pack_file, output_dir):
+    """Converts a solution pack to solution files, named after the index of
+    each puzzle in its pack, as solution0.txt, solution1.txt and so on.
+    Puzzles that couldn't be solved get no solution file.
+
+    Args:
+        pack_file: The name of the puzzle pack that was solved.
+        solution_pack_file: The name of its solution pack.
+        output_dir: The directory solution files are written to.
+
+    Returns:
+        The number of solution files written.
+    """
+
+    written = 0
+
+    with PuzzlePack(pack_file) as puzzles, SolutionPack(solution_pack_file) as solutions:
+        for i, solution in enumerate(solutions):
+            if solution is None:
+                continue
+
+            score, swaps, time = solution
+            # laid out as driver.solve_puzzle does, even with no swaps
+            lines = [puzzles.get_text(i), str(score),
+                     '\n'.join("{},{}".format(dev1, dev2) for dev1, dev2 in swaps), str(time)]
+
+            with open(os.path.join(output_dir, "solution{}.txt".format(i)), 'w') as f:
+                print('\n'.join(lines), file=f)
+
+            written += 1
+
+    return written
+
+
+if __name__ == "__main__":
+    # only needed from the command line, as the driver imports this module
+    from driver import find_puzzles
+
+    parser = argparse.ArgumentParser(description="Convert between puzzle and solution files "
+                                                 "and the packs the driver solves in batch.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = subparsers.add_parser('pack', help="pack puzzle files into a puzzle pack")
+    pack_parser.add_argument('pack_file',
+                             help="the puzzle pack to write (named *{})".format(PUZZLE_EXTENSION))
+    pack_parser.add_argument('puzzle_files', nargs='+', metavar='puzzle_file',
+                             help="puzzle files, or directories of puzzle*.txt files")
+
+    unpack_parser = subparsers.add_parser('unpack',
+                                          help="unpack a solution pack into solution files")
+    unpack_parser.add_argument('pack_file', help="the puzzle pack that was solved")
+    unpack_parser.add_argument('solution_pack_file', help="its solution pack")
+    unpack_parser.add_argument('--output-dir', default='.',
+                               help="the directory solution files are written to (default: .)")
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        puzzle_files = find_puzzles(args.puzzle_files)
+        pack_puzzles(puzzle_files, args.pack_file)
+        print("packed {} puzzles into {}".format(len(puzzle_files), args.pack_file))
+    else:
+        written = unpack_solutions(args.pack_file, args.solution_pack_file, args.output_dir)
+        print("wrote {} solution files to {}".format(written, args.output_dir))
@@ -1,9 +1,21 @@
+import heapq
+from itertools import count
+
+
 class PriorityQueue:
-    """Represents a custom priority queue instance. While Python has a
-    PriorityQueue library available, this is more efficient because it sorts on
-    dequeue, rather than enqueue."""
+    """Represents a custom priority queue instance. Items are kept in a binary
+    heap, so enqueue and dequeue are both O(log n), and each item's key is
+    computed only once, when it is enqueued. Items with equal keys are dequeued
+    newest first, which is the order the old sort-on-dequeue queue produced.
+
+    Items must be hashable. Equal items are treated as the same queue entry:
+    enqueueing an item that is already queued keeps whichever of the two would
+    be dequeued first and lazily deletes the other."""
+
+    # placeholder for the item of a heap entry that has been replaced
+    REMOVED = object()
 
-    def __init__(self, key, items=[]):
+    def __init__(self, key, items=None):
         """Initializes a PriorityQueue instance.
 
         Args:
@@ -12,27 +24,95 @@ class PriorityQueue:
         """
 
         self.key = key
-        self.items = items
+        self.heap = []          # heap of [key, tiebreak, item] entries
+        self.entries = {}       # maps each queued item to its heap entry
+        self.counter = count()  # insertion counter used to break ties
 
-    def enqueue(self, item):
-        """Add an item to the queue.
+        for item in items or []:
+            self.enqueue(item)
+
+    def enqueue(self, item, key=None):
+        """Add an item to the queue. If an equal item is already queued, the
+        new item replaces it only if it would be dequeued first.
 
         Args:
             item: The item that's being added.
+            key: The item's sort key, if it was already computed, otherwise
+                it's computed with the queue's key function.
+
+        Returns:
+            True if the item was added, False if an equal item already queued
+            takes priority over it.
         """
 
-        self.items.append(item)
+        # negate the counter so that the newest of equal keys comes out first
+        entry = [self.key(item) if key is None else key, -next(self.counter), item]
+        old = self.entries.get(item)
+
+        if old is not None:
+            # keep the queued item if it would still be dequeued first
+            if old[:2] < entry[:2]:
+                return False
+
+            # otherwise lazily delete it, it'll be skipped on dequeue
+            old[2] = PriorityQueue.REMOVED
+
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
+
+        return True
 
     def dequeue(self):
-        """Sort using our key function and pop an item from the queue.
+        """Pop the item with the lowest key from the queue.
+
+        Returns:
+            The item at the top of the queue.
+        """
+
+        while True:
+            item = heapq.heappop(self.heap)[2]
+
+            # skip over entries that were replaced after being queued
+            if item is not PriorityQueue.REMOVED:
+                del self.entries[item]
+                return item
+
+    def get_entries(self):
+        """Returns everything needed to rebuild the queue, see set_entries.
+
+        Returns:
+            A tuple of a list of (key, tiebreak, item) tuples for the queued
+            items, and the tiebreak counter's next value.
+        """
+
+        return [tuple(entry) for entry in self.entries.values()], next(self.counter)
+
+    def set_entries(self, entries, counter):
+        """Replaces the contents of the queue with entries from get_entries, so
+        that items come out in the same order they would have from the queue
+        the entries were taken from.
+
+        Args:
+            entries: A list of (key, tiebreak, item) tuples.
+            counter: The tiebreak counter's next value.
+        """
+
+        self.heap = [list(entry) for entry in entries]
+        heapq.heapify(self.heap)
+        self.entries = {entry[2]: entry for entry in self.heap}
+        self.counter = count(counter)
+
+    def __contains__(self, item):
+        """Overload __contains__ to test whether an equal item is queued.
+
+        Args:
+            item: The item to look for.
 
         Returns:
-            The item at the top of the queue, post-sorting.
+            True if an equal item is waiting in the queue, False otherwise.
         """
 
-        # reverse the sort as pop takes the last item from the queue
-        self.items.sort(key=self.key, reverse=True)
-        return self.items.pop()
+        return item in self.entries
 
     def __len__(self):
         """Overload __len__ to return length of queue.
@@ -41,4 +121,4 @@ class PriorityQueue:
             The number of items in our queue.
         """
 
-        return len(self.items)
+        return len(self.entries)
@@ -1,18 +1,38 @@
 #!/usr/bin/env python3
 
+import random
 import re
-from copy import copy
 from sys import exit
 
 class Puzzle:
-    """Represents a puzzle instance. This will act as the state of our tree node."""
+    """Represents a puzzle instance. This will act as the state of our tree node.
 
-    # regex to match three or more consecutive devices
-    DIGIT_REGEX = re.compile('(\\d)\\1{2,}')
+    The board is stored flat, as a bytearray of device numbers indexed by
+    y*width + x, with EMPTY marking a cleared cell. Text labels are only used
+    when parsing the input and printing the board."""
+
+    __slots__ = ('falling', 'score', 'replaced', 'quota', 'max_swaps',
+                 'num_device_types', 'width', 'height', 'pool_height',
+                 'bonus_rules', 'board', 'zobrist', 'key', 'moves', 'dirty', 'best_gain')
+
+    # value of a cell whose device has been removed
+    EMPTY = 0
+
+    # regex to match three or more consecutive (non-empty) devices
+    DEVICE_REGEX = re.compile(b'([^\\x00])\\1{2,}')
+
+    # fixed seed so that zobrist keys are stable from run to run
+    ZOBRIST_SEED = 5400
+
+    # zobrist tables, shared between all puzzles of the same dimensions
+    zobrist_tables = {}
+
+    # swap tables, shared between all puzzles of the same dimensions
+    swap_tables = {}
 
     def __init__(self, quota, max_swaps, num_device_types, width, height, pool_height, bonus_rules, board):
         """Initializes a puzzle instance.
-        
+
         Args:
             quota: Our target score.
             max_swaps: The maximum number of swaps allowed.
@@ -21,13 +41,14 @@ class Puzzle:
             height: The height of the board.
             pool_height: The height of our pool.
             bonus_rules: 1, 2, 3, or 0 if no bonus ruleset is used.
-            board: Our initial board state.
-        
+            board: Our initial board state, as rows of space separated labels,
+                or as a bytes-like object of device numbers (row by row), which
+                needs no parsing.
+
         Returns:
             A fully initialized Puzzle object.
         """
 
-        self.swaps = []         # holds tuples representing swap moves
         self.falling = False    # whether or not the board is in a falling state
         self.score = 0          # total number of devices removed
         self.replaced = 0       # devices removed per match-fall-replace cycle
@@ -39,25 +60,152 @@ class Puzzle:
         self.height = int(height)
         self.pool_height = int(pool_height)
         self.bonus_rules = int(bonus_rules)
-        self.board = [row.split() for row in board]
+
+        # new devices land in the pool, as they would otherwise drop straight
+        # onto the playfield, where refills can match again forever
+        if self.pool_height < 1:
+            raise ValueError("a puzzle needs a pool at least one row high")
+
+        if isinstance(board, (bytes, bytearray, memoryview)):
+            self.board = bytearray(board)
+        else:
+            self.board = bytearray(int(device) for row in board for device in row.split())
+
+        if len(self.board) != self.width * self.height:
+            raise ValueError("board doesn't match a {}x{} puzzle".format(self.width, self.height))
+
+        # zobrist key of the board, maintained incrementally as devices move
+        self.zobrist = self.get_zobrist_table(self.width, self.height, self.num_device_types)
+        self.key = 0
+
+        for i, device in enumerate(self.board):
+            self.key ^= self.zobrist[i][device]
+
+        # devices cleared by each valid swap (by index), and a bitmask of the
+        # cells changed since they were found (from scratch while it's None)
+        self.moves = None
+        self.dirty = 0
+
+        # most devices any one valid swap clears, found along with the moves
+        self.best_gain = 0
+
+    @classmethod
+    def get_zobrist_table(cls, width, height, num_device_types):
+        """Returns the zobrist table for boards of the given dimensions,
+        building it on first use.
+
+        Args:
+            width: The width of the board.
+            height: The height of the board.
+            num_device_types: The number of device types.
+
+        Returns:
+            A table of random 64-bit keys indexed by cell and device number.
+        """
+
+        dimensions = (width, height, num_device_types)
+
+        if dimensions not in cls.zobrist_tables:
+            rng = random.Random(cls.ZOBRIST_SEED)
+
+            # one key per device number, EMPTY included
+            cls.zobrist_tables[dimensions] = [
+                [rng.getrandbits(64) for device in range(num_device_types + 1)]
+                for i in range(width * height)]
+
+        return cls.zobrist_tables[dimensions]
+
+    def get_swap_table(self):
+        """Returns the swap table for this puzzle's dimensions, building it on
+        first use.
+
+        Returns:
+            A tuple of every swap on the playfield, in the order they're
+            scanned, and, for every cell, the indices of the swaps whose
+            validity depends on that cell.
+        """
+
+        dimensions = (self.width, self.height, self.pool_height)
+
+        if dimensions not in Puzzle.swap_tables:
+            swaps = []
+            affected = [[] for i in range(self.width * self.height)]
+
+            # horizontal swaps
+            for y in range(self.pool_height, self.height):
+                for x in range(self.width - 1):
+                    swaps.append(((x, y), (x + 1, y)))
+
+            # vertical swaps
+            for y in range(self.pool_height, self.height - 1):
+                for x in range(self.width):
+                    swaps.append(((x, y), (x, y + 1)))
+
+            for k, (dev1, dev2) in enumerate(swaps):
+                # a swap can only make a match within two cells of the swapped
+                # devices, along the row and the columns that it checks
+                if dev1[0] != dev2[0]:
+                    cells = [(x, dev1[1]) for x in range(dev1[0] - 2, dev2[0] + 3)]
+                    cells += [(x, y) for x in (dev1[0], dev2[0])
+                              for y in range(dev1[1] - 2, dev1[1] + 3)]
+                else:
+                    cells = [(dev1[0], y) for y in range(dev1[1] - 2, dev2[1] + 3)]
+                    cells += [(x, y) for y in (dev1[1], dev2[1])
+                              for x in range(dev1[0] - 2, dev1[0] + 3)]
+
+                for x, y in set(cells):
+                    # the pool is never checked for matches
+                    if 0 <= x < self.width and self.pool_height <= y < self.height:
+                        affected[y*self.width + x].append(k)
+
+            Puzzle.swap_tables[dimensions] = (swaps, [tuple(k) for k in affected])
+
+        return Puzzle.swap_tables[dimensions]
 
     def copy(self):
         """Copies a puzzle instance.
-        
+
         Returns:
             A deep copy of the puzzle object.
         """
 
-        new = copy(self)
-        new.swaps = self.swaps[:]
-        new.board = [row[:] for row in self.board]
+        new = object.__new__(type(self))
+
+        new.falling = self.falling
+        new.score = self.score
+        new.replaced = self.replaced
+        new.quota = self.quota
+        new.max_swaps = self.max_swaps
+        new.num_device_types = self.num_device_types
+        new.width = self.width
+        new.height = self.height
+        new.pool_height = self.pool_height
+        new.bonus_rules = self.bonus_rules
+        new.board = self.board[:]
+        new.zobrist = self.zobrist
+        new.key = self.key
+        new.moves = self.moves
+        new.dirty = self.dirty
+        new.best_gain = self.best_gain
 
         return new
 
+    def rows(self):
+        """Converts the board back to its text labels.
+
+        Returns:
+            A list of rows, each a list of device labels ('E' if empty).
+        """
+
+        labels = ['E'] + [str(device) for device in range(1, self.num_device_types + 1)]
+
+        return [[labels[device] for device in self.board[y*self.width:(y+1)*self.width]]
+                for y in range(self.height)]
+
     def print(self):
         """Prints the board."""
 
-        for i, row in enumerate(self.board):
+        for i, row in enumerate(self.rows()):
             # print line of asterisks to separate pool from board
             if i == self.pool_height:
                 print('-' * (len(row)*2-1))
@@ -66,18 +214,64 @@ class Puzzle:
 
     def swap(self, dev1, dev2):
         """Swaps the location of two devices on the board.
-        
+
         Args:
             dev1: The first device.
             dev2: The second device.
         """
 
-        # unpack devices into x, y coordinates
-        x1, y1 = dev1
-        x2, y2 = dev2
+        # unpack devices into flat board indices
+        i1 = dev1[1] * self.width + dev1[0]
+        i2 = dev2[1] * self.width + dev2[0]
+
+        device1, device2 = self.board[i1], self.board[i2]
+
+        # move each device's key from its old cell to its new one
+        self.key ^= (self.zobrist[i1][device1] ^ self.zobrist[i1][device2] ^
+                     self.zobrist[i2][device2] ^ self.zobrist[i2][device1])
 
         # perform swap using python magic
-        self.board[y1][x1], self.board[y2][x2] = self.board[y2][x2], self.board[y1][x1]
+        self.board[i1], self.board[i2] = device2, device1
+        self.dirty |= 1 << i1 | 1 << i2
+
+    def set_device(self, x, y, device):
+        """Places a device on the board, updating the zobrist key.
+
+        Args:
+            x: The x coordinate of the cell.
+            y: The y coordinate of the cell.
+            device: The number of the new device.
+        """
+
+        i = y * self.width + x
+
+        self.key ^= self.zobrist[i][self.board[i]] ^ self.zobrist[i][device]
+        self.board[i] = device
+        self.dirty |= 1 << i
+
+    def get_row(self, y):
+        """Returns a full row of the board.
+
+        Args:
+            y: The y coordinate of the row.
+
+        Returns:
+            The devices of the row as a bytearray.
+        """
+
+        return self.board[y*self.width:(y+1)*self.width]
+
+    def get_column(self, x):
+        """Returns the part of a column below the pool.
+
+        Args:
+            x: The x coordinate of the column.
+
+        Returns:
+            The devices of the column as a bytearray, top to bottom.
+        """
+
+        return self.board[self.pool_height*self.width + x::self.width]
 
     def get_match(self, is_row, row_col, x_y, offset=0):
         """Given a row or column, perform a regex match using backreferences to
@@ -89,13 +283,13 @@ class Puzzle:
             x_y: The x or y constant that devices in the row/column share.
             offset: Necessary to compensate for pool height if we're searching
                 a row, since we don't want to match rows inside the pool.
-        
+
         Returns:
             A list of locations of matching devices within the row or column.
         """
 
         # perform regex match on row/column
-        m = Puzzle.DIGIT_REGEX.search(''.join(row_col))
+        m = Puzzle.DEVICE_REGEX.search(row_col)
 
         if m:
             # if we're searching a row, loop over every matching x value
@@ -128,23 +322,17 @@ class Puzzle:
             x1, x2 = dev1[0], dev2[0]
             y = dev1[1]
 
-            matches += self.get_match(True, self.board[y], y)
-
-            col = [row[x1] for row in self.board[self.pool_height:]]
-            matches += self.get_match(False, col, x1, self.pool_height)
-
-            col = [row[x2] for row in self.board[self.pool_height:]]
-            matches += self.get_match(False, col, x2, self.pool_height)
+            matches += self.get_match(True, self.get_row(y), y)
+            matches += self.get_match(False, self.get_column(x1), x1, self.pool_height)
+            matches += self.get_match(False, self.get_column(x2), x2, self.pool_height)
         # vertical swap
-        else: 
+        else:
             x = dev1[0]
             y1, y2 = dev1[1], dev2[1]
 
-            matches += self.get_match(True, self.board[y1], y1)
-            matches += self.get_match(True, self.board[y2], y2)
-
-            col = [row[x] for row in self.board[self.pool_height:]]
-            matches += self.get_match(False, col, x, self.pool_height)
+            matches += self.get_match(True, self.get_row(y1), y1)
+            matches += self.get_match(True, self.get_row(y2), y2)
+            matches += self.get_match(False, self.get_column(x), x, self.pool_height)
 
         return matches
 
@@ -159,112 +347,240 @@ class Puzzle:
         matches = []
 
         # check horizontal matches (pool excluded)
-        for y, row in enumerate(self.board[self.pool_height:]):
-            matches += self.get_match(True, row, y, self.pool_height)
+        for y in range(self.pool_height, self.height):
+            matches += self.get_match(True, self.get_row(y), y)
+
+        # check vertical matches the same way, one column slice at a time
+        for x in range(self.width):
+            matches += self.get_match(False, self.get_column(x), x, self.pool_height)
+
+        return matches
+
+    def get_region_matches(self, bottom, columns):
+        """Returns the matches in the part of the board that a collapse
+        changed: every row down to and including bottom (pool excluded) and
+        the given columns. Matches are found exactly as get_all_matches would.
+
+        Args:
+            bottom: The lowest row that changed.
+            columns: The x coordinates of the columns that changed.
+
+        Returns:
+            A list of locations of matching devices on the board.
+        """
+
+        matches = []
+
+        for y in range(self.pool_height, bottom + 1):
+            matches += self.get_match(True, self.get_row(y), y)
+
+        for x in sorted(columns):
+            matches += self.get_match(False, self.get_column(x), x, self.pool_height)
 
-        # check vertical matches the same way by transposing the list
-        for x, col in enumerate(zip(*self.board[self.pool_height:])):
-            matches += self.get_match(False, col, x, self.pool_height)
-            
         return matches
 
     def remove_matches(self, matches):
-        """Remove matches from the board. Begins a falling cycle.
-        
+        """Remove matches from the board, then let devices fall and be replaced
+        for as long as the refilled board has matches.
+
+        Each wave only rescans the rows and columns it changed, so the board
+        must have had no matches before the swap that produced matches (or,
+        for the root, matches must come from get_all_matches).
+
         Args:
             matches: A list of locations of matches to be removed.
-        """
 
-        self.replaced = 0
+        Returns:
+            The number of waves of matches that were removed.
+        """
 
-        # end recursion if there are no more matches
-        if not matches:
-            return
+        waves = 0
 
-        for x, y in matches:
-            self.score += 1
-            self.board[y][x] = 'E'
+        while matches:
+            waves += 1
+            self.replaced = 0
             self.falling = True
 
-        while self.falling:
-            self.simulate_falling()
+            # each location counts, even if a device is in two matches
+            self.score += len(matches)
 
-        self.remove_matches(self.get_all_matches())
+            for x, y in matches:
+                self.set_device(x, y, Puzzle.EMPTY)
 
-    def simulate_falling(self):
-        """Account for devices falling into empty spaces on the board."""
+            # devices are replaced in row-major order of the cleared cells
+            cleared = sorted({y*self.width + x for x, y in matches})
+            columns = self.collapse(cleared)
 
-        self.falling = False
+            self.falling = False
+            matches = self.get_region_matches(cleared[-1] // self.width, columns)
 
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.board[y][x] == 'E':
-                    self.falling = True
-                    self.replace_device(x, y)
+        self.replaced = 0
+
+        return waves
+
+    def collapse(self, cleared):
+        """Account for devices falling into empty spaces on the board. Each
+        column with cleared cells is compacted in one pass: surviving devices
+        fall to the bottom and new devices are stacked on top of them.
 
-    def get_new_device(self, x):
-        """Formula for replacing devices at top of pool.
-        
         Args:
-            x: The x coordinate of the device.
-        
+            cleared: The flat indices of the cleared cells, in ascending order.
+
         Returns:
-            A string label of the new device.
+            The set of x coordinates of the columns that changed.
         """
 
-        return str((int(self.board[1][x]) + x + self.replaced) % self.num_device_types + 1)
+        new_devices = {}    # new devices per column, in the order they drop
+
+        for i in cleared:
+            x = i % self.width
+
+            # each new device lands on the one that was dropped before it, or
+            # on top of the column (the row below, if the top was cleared)
+            if x in new_devices:
+                below = new_devices[x][-1]
+            elif i == x:
+                below = self.board[self.width + x]
+            else:
+                below = self.board[x]
+
+            self.replaced += 1
+            new_devices.setdefault(x, []).append(self.get_new_device(x, below))
+
+        for x, devices in new_devices.items():
+            # only the rows down to the lowest cleared cell are affected
+            end = max(i for i in cleared if i % self.width == x) + 1
+            column = self.board[x:end:self.width]
+
+            # the last device dropped ends up on top
+            devices.reverse()
+            compacted = bytearray(devices) + column.replace(b'\x00', b'')
+
+            for y, (old, new) in enumerate(zip(column, compacted)):
+                if old != new:
+                    i = y*self.width + x
+                    self.key ^= self.zobrist[i][old] ^ self.zobrist[i][new]
+                    self.dirty |= 1 << i
+
+            self.board[x:end:self.width] = compacted
+
+        return set(new_devices)
+
+    def get_new_device(self, x, below):
+        """Formula for replacing devices at top of pool.
 
-    def replace_device(self, x, y):
-        """Replace device either by falling or using the replacement formula.
-        
         Args:
             x: The x coordinate of the device.
-            y: The y coordinate of the device.
+            below: The device that the new device will land on.
+
+        Returns:
+            The number of the new device.
         """
 
-        # if top row, replace via formula
-        if y == 0:
-            self.replaced += 1
-            self.board[y][x] = self.get_new_device(x)
+        return (below + x + self.replaced) % self.num_device_types + 1
+
+    def update_moves(self):
+        """Bring the valid swaps up to date with the board. They're kept
+        between calls (and inherited by copies), so only the swaps near cells
+        that changed since the last call are simulated again, and the best
+        gain is only found again if they did. This relies on the board having
+        no matches, as it does once remove_matches is done."""
+
+        if self.moves is not None and not self.dirty:
+            return
+
+        swaps, affected = self.get_swap_table()
+
+        if self.moves is None:
+            self.moves = self.test_swaps(range(len(swaps)))
         else:
-            self.swap((x, y), (x, y - 1))
+            stale = set()
+            dirty = self.dirty
+
+            # visit the dirty cells one set bit at a time, lowest first
+            while dirty:
+                bit = dirty & -dirty
+                stale.update(affected[bit.bit_length() - 1])
+                dirty ^= bit
+
+            moves = {k: cleared for k, cleared in self.moves.items() if k not in stale}
+            moves.update(self.test_swaps(sorted(stale)))
+            self.moves = moves
+
+        self.dirty = 0
+        self.best_gain = max(self.moves.values(), default=0)
+
+    def get_move_gains(self):
+        """Return the swaps that would result in a match, along with the number
+        of devices each one clears before anything falls. See update_moves.
+
+        Returns:
+            A list of (swap, cleared) tuples, where swap is a pair of device
+            locations and cleared is the score its first match adds.
+        """
+
+        self.update_moves()
+        swaps = self.get_swap_table()[0]
+
+        # keep the order in which the whole playfield would be scanned
+        return [(swaps[k], self.moves[k]) for k in sorted(self.moves)]
+
+    def get_best_gain(self):
+        """Return the most devices any one valid swap clears before anything
+        falls, without listing the swaps. See update_moves.
 
-            # if replaced by falling, immediately replace where it fell from
-            self.replace_device(x, y - 1)
+        Returns:
+            The score the best swap's first match adds, 0 if there's no valid
+            swap.
+        """
+
+        self.update_moves()
+
+        return self.best_gain
 
     def get_valid_moves(self):
-        """Simulate swaps and return only those that would result in a match.
-        
+        """Return only the swaps that would result in a match. See
+        get_move_gains.
+
         Returns:
             A list of device locations. Swapping any of these will result in at
             least one match.
         """
 
-        moves = []
+        return [move for move, cleared in self.get_move_gains()]
 
-        # check horizontal swaps
-        for y in range(self.pool_height, self.height):
-            for x in range(self.width - 1):
-                self.swap((x, y), (x + 1, y))
+    def test_swaps(self, indices):
+        """Simulate swaps and return only those that would result in a match.
 
-                if self.get_matches((x, y), (x+1, y)):
-                    moves.append(((x, y), (x + 1, y)))
+        Args:
+            indices: The indices of the swaps to test in the swap table.
 
-                # undo swap
-                self.swap((x, y), (x + 1, y))
+        Returns:
+            A dict mapping the index of each swap that results in at least one
+            match to the number of devices that match.
+        """
+
+        swaps = self.get_swap_table()[0]
+        board = self.board
+        valid = {}
+
+        for k in indices:
+            dev1, dev2 = swaps[k]
+            i1 = dev1[1] * self.width + dev1[0]
+            i2 = dev2[1] * self.width + dev2[0]
 
-        # check vertical swaps
-        for y in range(self.pool_height, self.height - 1):
-            for x in range(self.width):
-                self.swap((x, y), (x, y + 1))
+            # swap the devices in place, leaving the key and dirty cells alone
+            board[i1], board[i2] = board[i2], board[i1]
 
-                if self.get_matches((x, y), (x, y+1)):
-                    moves.append(((x, y), (x, y + 1)))
+            cleared = len(self.get_matches(dev1, dev2))
 
-                # undo swap
-                self.swap((x, y), (x, y + 1))
+            if cleared:
+                valid[k] = cleared
 
-        return moves
+            # undo swap
+            board[i1], board[i2] = board[i2], board[i1]
+
+        return valid
 
     def __eq__(self, other):
         """Overload equal operator to define equality for puzzle instances.
@@ -277,3 +593,12 @@ class Puzzle:
         """
 
         return self.board == other.board and self.score == other.score
+
+    def __hash__(self):
+        """Overload hash so equal puzzle instances can share a set or dict slot.
+
+        Returns:
+            A hash of the zobrist key and score.
+        """
+
+        return hash((self.key, self.score))
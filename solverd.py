@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer
+
+# local imports
+from driver import STRATEGIES, on_timeout, solve_puzzle
+from engines import ENGINES
+from heuristics import HEURISTICS
+from swapcache import SwapCache
+from tree import Tree
+
+# most swap caches a worker keeps warm at once, one per kind of puzzle
+WARM_CACHES = 4
+
+# swap caches of this worker process, by engine, dimensions and device types,
+# least recently used first
+caches = OrderedDict()
+
+# size of each swap cache of this worker process, in bytes
+cache_size = Tree.CACHE_SIZE
+
+
+def _init_worker(size):
+    """Initializer of each worker process, so every job it solves shares the
+    same swap caches.
+
+    Args:
+        size: The most bytes each swap cache may hold.
+    """
+
+    global cache_size
+    cache_size = size
+
+
+def get_cache(engine, lines):
+    """Returns the swap cache of this worker for puzzles like the one given.
+    Swap outcomes only carry over between puzzles with the same engine,
+    dimensions and device types, as boards are keyed by their zobrist key.
+
+    Args:
+        engine: The name of the engine the puzzle is solved with.
+        lines: The lines of the puzzle file.
+
+    Returns:
+        A SwapCache, kept warm from earlier jobs if there were any.
+    """
+
+    kind = (engine,) + tuple(int(value) for value in lines[2:6])
+
+    if kind in caches:
+        caches.move_to_end(kind)
+    else:
+        caches[kind] = SwapCache(cache_size)
+
+        if len(caches) > WARM_CACHES:
+            caches.popitem(last=False)
+
+    return caches[kind]
+
+
+def run_job(job, timeout):
+    """Solves the puzzle of a job in a worker process.
+
+    Args:
+        job: A job as returned by parse_job.
+        timeout: Seconds the puzzle may run for, or None for no limit.
+
+    Returns:
+        The response to the job.
+    """
+
+    start_time = default_timer()
+    options = dict(job['options'], engine=ENGINES[job['options']['engine']],
+                   heuristic=HEURISTICS[job['options']['heuristic']])
+
+    if 'file' in job:
+        with open(job['file']) as f:
+            puzzle = f.read()
+    else:
+        puzzle = job['puzzle']
+
+    # the alarm interrupts the search itself, so the worker is free again
+    if timeout:
+        signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        cache = get_cache(job['options']['engine'], puzzle.splitlines())
+        solution, score = solve_puzzle(puzzle, cache=cache, **options)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return {
+        'id': job['id'],
+        'score': score,
+        'solution': solution,
+        'time': default_timer() - start_time,
+        'cache': {'hits': cache.hits, 'misses': cache.misses},
+    }
+
+
+def parse_job(line):
+    """Parses and checks a job line.
+
+    A job is a JSON object with the puzzle file's text as "puzzle", or its
+    name as "file", and optionally an "id" to tag the response with, a
+    "timeout" in seconds and any of the search options "strategy", "engine",
+    "heuristic", "beam_width", "beam_seed" and "deadline", which default as
+    they do in driver.py.
+
+    Args:
+        line: A line read from a client.
+
+    Returns:
+        A dict of the job's id, its puzzle text or file, its timeout and its
+        search options.
+
+    Raises:
+        ValueError: If the line isn't a valid job.
+    """
+
+    request = json.loads(line)
+
+    if not isinstance(request, dict):
+        raise ValueError("a job must be a JSON object")
+
+    if ('puzzle' in request) == ('file' in request):
+        raise ValueError("a job needs exactly one of puzzle and file")
+
+    options = {
+        'strategy': request.get('strategy', 'astargs'),
+        'engine': request.get('engine', 'regex'),
+        'heuristic': request.get('heuristic', 'needed_gain'),
+        'beam_width': request.get('beam_width', Tree.BEAM_WIDTH),
+        'beam_seed': request.get('beam_seed'),
+        'deadline': request.get('deadline'),
+    }
+
+    for name, choices in (('strategy', STRATEGIES), ('engine', ENGINES), ('heuristic', HEURISTICS)):
+        if options[name] not in choices:
+            raise ValueError("{} must be one of {}".format(name, ', '.join(choices)))
+
+    if not isinstance(options['beam_width'], int) or options['beam_width'] < 1:
+        raise ValueError("beam_width must be a positive integer")
+
+    for name, value in (('beam_seed', options['beam_seed']), ('deadline', options['deadline']),
+                        ('timeout', request.get('timeout'))):
+        if value is not None and not isinstance(value, (int, float)):
+            raise ValueError("{} must be a number".format(name))
+
+    job = {'id': request.get('id'), 'timeout': request.get('timeout'), 'options': options}
+    job.update((key, request[key]) for key in ('puzzle', 'file') if key in request)
+
+    return job
+
+
+def serve(infile, outfile, pool, timeout=None):
+    """Reads jobs from a client a line at a time and hands each to the pool
+    as soon as it's read, so a client can pipeline any number of them. Each
+    response is written as a line of JSON once its job is done, in the order
+    they finish, tagged with the job's id.
+
+    A response has the job's "id", its "score", its "solution" (the contents
+    of its solution file), the "time" it took and the hits and misses of the
+    swap "cache" it used, or its "id" and an "error" if it couldn't be solved.
+
+    Args:
+        infile: The binary stream jobs are read from.
+        outfile: The binary stream responses are written to.
+        pool: The ProcessPoolExecutor that solves the jobs.
+        timeout: Seconds each job may run for unless it says otherwise, or
+            None for no limit.
+    """
+
+    lock = threading.Lock()
+
+    # number of jobs whose response hasn't been written yet
+    pending = 0
+    written = threading.Condition(lock)
+
+    def respond(response):
+        with lock:
+            try:
+                outfile.write(json.dumps(response).encode() + b'\n')
+                outfile.flush()
+            except OSError:
+                pass    # the client hung up, the job's done anyway
+
+    def on_done(job_id, future):
+        nonlocal pending
+
+        try:
+            response = future.result()
+        except Exception as e:
+            response = {'id': job_id, 'error': "{}: {}".format(type(e).__name__, e)}
+
+        respond(response)
+
+        with written:
+            pending -= 1
+            written.notify()
+
+    for line in infile:
+        if not line.strip():
+            continue
+
+        try:
+            job = parse_job(line)
+        except ValueError as e:
+            respond({'id': None, 'error': "ValueError: {}".format(e)})
+            continue
+
+        with lock:
+            pending += 1
+
+        future = pool.submit(run_job, job, job['timeout'] or timeout)
+        future.add_done_callback(lambda future, job_id=job['id']: on_done(job_id, future))
+
+    # a client that's done sending still gets every response, which is only
+    # certain once the callbacks have written them, not once the jobs are done
+    with written:
+        written.wait_for(lambda: pending == 0)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Serves the jobs of one client connected to the solver's socket."""
+
+    def handle(self):
+        serve(self.rfile, self.wfile, self.server.pool, self.server.job_timeout)
+
+
+def serve_socket(path, pool, timeout=None):
+    """Serves jobs to any number of clients at once on a Unix domain socket,
+    until interrupted or terminated. Every client shares the same pool.
+
+    Args:
+        path: The path of the socket.
+        pool: The ProcessPoolExecutor that solves the jobs.
+        timeout: Seconds each job may run for unless it says otherwise.
+    """
+
+    # a socket left behind by a solver that was killed is replaced
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+
+    # stop on a plain kill as cleanly as on an interrupt
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = socketserver.ThreadingUnixStreamServer(path, JobHandler)
+    server.daemon_threads = True
+    server.pool = pool
+    server.job_timeout = timeout
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve puzzles sent as JSON lines, on stdin or "
+                                                 "a Unix domain socket, with a pool of warm "
+                                                 "worker processes.")
+    parser.add_argument('--socket',
+                        help="the path of a Unix domain socket to serve clients on "
+                             "(default: read jobs from stdin, answer on stdout)")
+    parser.add_argument('--jobs', type=int,
+                        help="the number of worker processes (default: one per core)")
+    parser.add_argument('--timeout', type=float,
+                        help="seconds each job may run for unless it sets its own "
+                             "(default: no limit)")
+    parser.add_argument('--cache-size', type=float, default=Tree.CACHE_SIZE / 2**20,
+                        help="megabytes of swap outcomes each worker keeps per kind of puzzle "
+                             "(default: %(default)g)")
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=args.jobs or os.cpu_count(), initializer=_init_worker,
+                             initargs=(int(args.cache_size * 2**20),)) as pool:
+        if args.socket:
+            serve_socket(args.socket, pool, args.timeout)
+        else:
+            serve(sys.stdin.buffer, sys.stdout.buffer, pool, args.timeout)
@@ -0,0 +1,137 @@
+from collections import Counter
+from time import perf_counter
+
+
+class TimedSet(set):
+    """A set whose membership tests and additions are timed, and whose
+    successful membership tests are counted as duplicates, for SearchStats."""
+
+    def __init__(self, stats):
+        """Initializes an empty TimedSet instance.
+
+        Args:
+            stats: The SearchStats to report to.
+        """
+
+        super().__init__()
+        self.stats = stats
+
+    def __contains__(self, item):
+        start = perf_counter()
+        found = super().__contains__(item)
+        self.stats.timers['explored'] += perf_counter() - start
+
+        if found:
+            self.stats.duplicates += 1
+
+        return found
+
+    def add(self, item):
+        start = perf_counter()
+        super().add(item)
+        self.stats.timers['explored'] += perf_counter() - start
+
+
+class SearchStats:
+    """Counters and cumulative phase timers for a search. Nothing is collected
+    unless a Tree is given a SearchStats, in which case only the objects and
+    methods being measured are swapped for timed ones, so the searches
+    themselves carry no instrumentation."""
+
+    # phases that time is tracked for
+    PHASES = ('moves', 'expand', 'queue', 'explored')
+
+    def __init__(self):
+        """Initializes a SearchStats instance."""
+
+        self.expanded = 0           # nodes whose valid moves were generated
+        self.duplicates = 0         # children dropped as already seen
+        self.peak_frontier = 0      # most nodes waiting in the frontier at once
+        self.cascades = Counter()   # swaps played out, by number of waves
+        self.timers = dict.fromkeys(SearchStats.PHASES, 0.0)
+
+    def timed(self, phase, function):
+        """Wraps a function so that the time spent in it counts towards a phase.
+
+        Args:
+            phase: The name of the phase.
+            function: The function to wrap.
+
+        Returns:
+            The wrapped function.
+        """
+
+        timers = self.timers
+
+        def wrapper(*args):
+            start = perf_counter()
+            result = function(*args)
+            timers[phase] += perf_counter() - start
+
+            return result
+
+        return wrapper
+
+    def watch_tree(self, tree):
+        """Times a tree's move generation and node expansion, and counts the
+        nodes whose moves are generated as expanded. Ranking a node counts as
+        move generation, as heuristics rank a node by its valid swaps, which
+        its expansion then reuses.
+
+        Args:
+            tree: The Tree to watch.
+        """
+
+        get_moves = self.timed('moves', tree.get_moves)
+
+        def watched_get_moves(node):
+            self.expanded += 1
+            return get_moves(node)
+
+        tree.get_moves = watched_get_moves
+        tree.rank = self.timed('moves', tree.rank)
+        tree.expand = self.timed('expand', tree.expand)
+
+    def watch_queue(self, frontier):
+        """Times a frontier's enqueues and dequeues, tracks its peak size and
+        counts the items it refuses as duplicates.
+
+        Args:
+            frontier: The PriorityQueue to watch.
+
+        Returns:
+            The same queue.
+        """
+
+        enqueue = self.timed('queue', frontier.enqueue)
+
+        def watched_enqueue(*args):
+            added = enqueue(*args)
+
+            if added:
+                self.peak_frontier = max(self.peak_frontier, len(frontier))
+            else:
+                self.duplicates += 1
+
+            return added
+
+        frontier.enqueue = watched_enqueue
+        frontier.dequeue = self.timed('queue', frontier.dequeue)
+        self.peak_frontier = max(self.peak_frontier, len(frontier))
+
+        return frontier
+
+    def as_dict(self):
+        """Returns the stats in a form that can be dumped as JSON.
+
+        Returns:
+            A dict of the counters, the cascade histogram and the timers.
+        """
+
+        return {
+            'expanded': self.expanded,
+            'duplicates': self.duplicates,
+            'peak_frontier': self.peak_frontier,
+            'cascade_waves': {str(waves): count for waves, count in sorted(self.cascades.items())},
+            'timers': {phase: round(time, 6) for phase, time in self.timers.items()},
+        }
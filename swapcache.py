@@ -0,0 +1,86 @@
+import sys
+from collections import OrderedDict
+
+
+class SwapCache:
+    """Represents a bounded least-recently-used cache of the outcomes of swaps.
+    Entries are keyed by the zobrist key of the board a swap is made on and
+    the swap itself, so transpositions (the same board reached by different
+    swap orders) and re-expanded nodes skip the swap and cascade entirely.
+
+    The cache holds at most max_size bytes, as estimated by sys.getsizeof, and
+    evicts the least recently used entries to stay under it."""
+
+    # rough cost of an entry's slot in the ordered dict itself
+    ENTRY_OVERHEAD = 100
+
+    def __init__(self, max_size):
+        """Initializes a SwapCache instance.
+
+        Args:
+            max_size: The most bytes the cache may hold, 0 to disable it.
+        """
+
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()    # maps each key to (value, size)
+
+        self.hits = 0           # lookups that found an entry
+        self.misses = 0         # lookups that didn't
+        self.evictions = 0      # entries dropped to stay under max_size
+
+    def get(self, key):
+        """Look up the outcome of a swap, marking it as recently used.
+
+        Args:
+            key: A tuple of the board's zobrist key and the swap.
+
+        Returns:
+            The cached value, or None if there isn't one.
+        """
+
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return entry[0]
+
+    def put(self, key, value):
+        """Cache the outcome of a swap, evicting the least recently used
+        entries if the cache grows past its size.
+
+        Args:
+            key: A tuple of the board's zobrist key and the swap.
+            value: A tuple of the outcome to cache.
+        """
+
+        size = (SwapCache.ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value) +
+                sum(sys.getsizeof(item) for item in value))
+
+        # an entry bigger than the whole cache would only evict everything
+        if size > self.max_size:
+            return
+
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+
+        self.entries[key] = (value, size)
+        self.size += size
+
+        while self.size > self.max_size:
+            self.size -= self.entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def __len__(self):
+        """Overload __len__ to return the number of cached swaps.
+
+        Returns:
+            The number of entries in our cache.
+        """
+
+        return len(self.entries)
@@ -0,0 +1,135 @@
+import random
+import unittest
+
+# local imports
+from layerstore import LayerStore
+
+
+class LayerStoreTest(unittest.TestCase):
+    """Checks the layers external_bfts keeps on disk: boards packed and
+    unpacked, swap indices of large swap tables, the records kept when a
+    layer is finished and the swaps rebuilt from them. Layers are built both
+    in memory and spilled a record at a time, which merges runs in passes."""
+
+    # fixed seed so that failures can be reproduced
+    SEED = 5400
+
+    # bytes of buffer that hold every record, and that spill every record
+    BUFFER_SIZES = (1 << 20, 1)
+
+    def make_store(self, cells=6, num_device_types=4, actions=16, buffer_size=1 << 20):
+        """Makes a store, removed once the test is done.
+
+        Args:
+            cells: The number of cells of each board.
+            num_device_types: The number of device types.
+            actions: The number of swaps in the swap table.
+            buffer_size: The most bytes of records held in memory at once.
+
+        Returns:
+            A new LayerStore instance, with the root's layer finished.
+        """
+
+        store = LayerStore(cells, num_device_types, actions, buffer_size)
+        self.addCleanup(store.close)
+
+        store.add(bytes(cells), 0, 0, 0)
+        store.finish()
+
+        return store
+
+    def test_pack(self):
+        rng = random.Random(LayerStoreTest.SEED)
+
+        for num_device_types, packed in ((15, True), (16, False)):
+            for cells in (1, 7, 8):
+                with self.subTest(num_device_types=num_device_types, cells=cells):
+                    store = self.make_store(cells, num_device_types)
+                    self.assertEqual(store.packed, packed)
+
+                    for i in range(20):
+                        board = bytes(rng.randint(0, num_device_types) for cell in range(cells))
+                        stored = store.pack(board)
+
+                        self.assertEqual(len(stored), (cells + 1) // 2 if packed else cells)
+                        self.assertEqual(store.unpack(stored), board)
+
+    def test_long_swap_table(self):
+        for actions in (LayerStore.SHORT_ACTIONS, LayerStore.SHORT_ACTIONS + 1, 100000):
+            with self.subTest(actions=actions):
+                store = self.make_store(actions=actions)
+
+                store.add(bytes([1, 2, 3, 1, 2, 3]), 3, 0, actions - 1)
+                self.assertEqual(store.finish(), 1)
+                self.assertEqual(store.get_actions(1, 0), [actions - 1])
+
+    def test_duplicates(self):
+        board = bytes([1, 2, 1, 2, 1, 2])
+
+        for buffer_size in LayerStoreTest.BUFFER_SIZES:
+            with self.subTest(buffer_size=buffer_size):
+                store = self.make_store(buffer_size=buffer_size)
+
+                # the best of each board is kept, whatever order they come in
+                for score in (5, 9, 7, 9):
+                    store.add(board, score, 0, score)
+
+                store.add(bytes([3, 3, 1, 3, 3, 1]), 6, 0, 1)
+
+                self.assertEqual(store.finish(), 2)
+                self.assertEqual(sorted(score for board, score in store.read(1)), [6, 9])
+                self.assertEqual(store.dominated, 3)
+
+    def test_dominated(self):
+        first, second = bytes([1, 2, 1, 2, 1, 2]), bytes([2, 1, 2, 1, 2, 1])
+
+        for buffer_size in LayerStoreTest.BUFFER_SIZES:
+            with self.subTest(buffer_size=buffer_size):
+                store = self.make_store(buffer_size=buffer_size)
+
+                store.add(first, 10, 0, 0)
+                store.add(second, 4, 0, 1)
+                self.assertEqual(store.finish(), 2)
+
+                # as much score in more swaps can't do better, more score can
+                store.add(first, 10, 0, 2)
+                store.add(second, 5, 1, 3)
+                self.assertEqual(store.finish(), 1)
+                self.assertEqual(list(store.read(2)), [(bytearray(second), 5)])
+
+                # the root's board was seen first of all
+                store.add(bytes(6), 0, 0, 4)
+                store.add(first, 8, 0, 5)
+                self.assertEqual(store.finish(), 0)
+                self.assertEqual(store.dominated, 3)
+
+    def test_get_actions(self):
+        rng = random.Random(LayerStoreTest.SEED + 1)
+
+        for buffer_size in LayerStoreTest.BUFFER_SIZES:
+            with self.subTest(buffer_size=buffer_size):
+                store = self.make_store(cells=8, actions=1000, buffer_size=buffer_size)
+
+                # the swaps of each board, by its board, as layers are sorted
+                paths = {bytes(8): []}
+                parents = [bytes(8)]
+
+                for depth in range(1, 5):
+                    for i in range(100):
+                        parent = rng.randrange(len(parents))
+                        board = bytes(rng.randint(1, 4) for cell in range(8))
+                        action = rng.randrange(1000)
+
+                        if board not in paths:
+                            paths[board] = paths[parents[parent]] + [action]
+                            store.add(board, depth, parent, action)
+
+                    store.finish()
+                    parents = [bytes(board) for board, score in store.read(depth)]
+
+                    for index, board in enumerate(parents):
+                        self.assertEqual(store.get_actions(depth, index), paths[board])
+
+
+if __name__ == '__main__':
+    unittest.main()
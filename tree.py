@@ -1,19 +1,106 @@
+import heapq
+import math
+import multiprocessing
+import random
 from collections import deque
+from functools import partial, reduce
+from operator import getitem, xor
 from pprint import pprint
+from timeit import default_timer
 
 # local imports
-from node import Node
+from dominance import DominanceTable
+from heuristics import needed_gain
+from layerstore import LayerStore
+from node import Node, Successor
 from priorityqueue import PriorityQueue
+from stats import SearchStats, TimedSet
+from swapcache import SwapCache
+
+
+# shared by every worker of a parallel search, the fewest swaps any worker
+# reached the quota in and that goal's score, see _init_worker
+incumbent = None
+
+
+def _init_worker(swaps, score):
+    """Initializes a parallel search worker process.
+
+    Args:
+        swaps: A multiprocessing.Value of the fewest swaps any worker reached
+            the quota in, more than max swaps until one does.
+        score: A multiprocessing.Value of the score of that goal.
+    """
+
+    global incumbent
+    incumbent = (swaps, score)
+
+
+def _search_subtree(root, action, cache_size, heuristic, lazy):
+    """Runs A* on the subtree below one of the root's swaps, in a worker. If
+    it reaches the quota in fewer swaps than the incumbent, its goal becomes
+    the incumbent.
+
+    Args:
+        root: The root node of the whole search.
+        action: The swap that leads from the root to the subtree.
+        cache_size: The most bytes the worker's swap cache may hold.
+        heuristic: The astargs heuristic to search with.
+        lazy: Whether astargs defers creating children, see Tree.next_node.
+
+    Returns:
+        The swaps performed by the node with highest score in the subtree,
+        which is a goal node if the subtree reached the quota.
+    """
+
+    tree = Tree(root.state, cache_size, heuristic=heuristic)
+    tree.lazy = lazy
+    tree.root = tree.max_node = tree.expand(root, action)
+    tree.astargs(incumbent)
+
+    node = tree.max_node
+    swaps, score = incumbent
+
+    # let the other workers know which goals they can still beat
+    if node.state.score >= node.state.quota:
+        with swaps.get_lock():
+            if (node.cost, -node.state.score) < (swaps.value, -score.value):
+                swaps.value, score.value = node.cost, node.state.score
+
+    return node.get_swaps()
 
 
 class Tree:
     """Represents a tree instance. This is where the magic happens."""
 
-    def __init__(self, top):
+    # default size of the swap cache, in bytes
+    CACHE_SIZE = 64 << 20
+
+    # weights of the estimate in the rounds of anytime_astargs after the first,
+    # relaxed in turn
+    ANYTIME_WEIGHTS = (5, 3, 2, 1)
+
+    # killer moves remembered per depth by the depth-first searches
+    KILLERS = 2
+
+    # default number of nodes beam keeps at each depth
+    BEAM_WIDTH = 64
+
+    # default size of the in-memory buffer of external_bfts, in bytes
+    SPILL_SIZE = 64 << 20
+
+    def __init__(self, top, cache_size=CACHE_SIZE, stats=False, heuristic=needed_gain, cache=None):
         """Initializes a tree instance.
 
         Args:
             top: A puzzle instance that represents the root of our tree
+            cache_size: The most bytes the swap cache may hold, 0 to disable.
+            stats: Whether to collect SearchStats on the searches.
+            heuristic: The function that ranks nodes for astargs, lowest
+                first, see heuristics.py.
+            cache: A SwapCache to use instead of a new one of cache_size, so
+                that trees of puzzles with the same dimensions, device types
+                and engine can share swap outcomes.
 
         Returns:
             A fully initialized tree object.
@@ -25,6 +112,45 @@ class Tree:
         # immediately remove any matches that our board may have started with
         self.root.state.remove_matches(self.root.state.get_all_matches())
 
+        # outcomes of swaps, shared by every search on this tree
+        self.cache = cache if cache is not None else SwapCache(cache_size)
+
+        # number of child nodes generated by every search on this tree
+        self.nodes = 0
+
+        self.heuristic = heuristic
+
+        # most score any one swap has gained so far, cascades included
+        self.gain_bound = 0
+
+        # whether the depth-first searches may prune on the gain bound, which
+        # is faster but can miss goals, see can_reach_quota
+        self.inexact = False
+
+        # whether astargs defers creating children until they reach the front
+        # of its frontier, which is faster but ranks them less exactly, see
+        # next_node
+        self.lazy = False
+
+        # swaps that led towards the best score, by the depth they're made at
+        self.killers = {}
+
+        # best scores and costs per board of the last search that prunes on them
+        self.dominance = DominanceTable()
+
+        # periodic snapshots of astargs and bfts, only taken if asked for
+        self.checkpoint = None
+
+        # states kept in each layer and runs spilled by the last external_bfts
+        self.layers = None
+
+        # counters and timers, only collected if asked for
+        self.stats = None
+
+        if stats:
+            self.stats = SearchStats()
+            self.stats.watch_tree(self)
+
     # breadth-first tree search algorithm for traversing tree
     def bfts(self):
         """Generate, traverse and evaluate tree nodes based on a breadth-first
@@ -39,6 +165,17 @@ class Tree:
         # initialize our frontier as a FIFO queue with the root node on top
         frontier = deque([self.root])
 
+        # best score and cost seen for each board, so beaten states are dropped
+        self.dominance = DominanceTable()
+        self.dominance.dominates(self.root)
+
+        # pick up where a checkpointed search left off, its next node first
+        if self.checkpoint is not None:
+            node = self.checkpoint.start(self, frontier, None)
+
+            if node is not None:
+                frontier.append(node)
+
         # while we still have nodes to evaluate
         while len(frontier) > 0:
             node = frontier.pop()
@@ -56,26 +193,326 @@ class Tree:
                 break
             
             # for every valid swap
-            for dev1, dev2 in node.state.get_valid_moves():
-                # create a new node as a copy of the current
-                new_node = Node(node.state, (dev1, dev2), node, node.cost)
-
-                # swap dev1 and dev2
-                new_node.perform_action()
+            for dev1, dev2 in self.get_moves(node):
+                # create the node that swapping dev1 and dev2 leads to
+                new_node = self.expand(node, (dev1, dev2))
 
-                # remove any matches
-                new_node.state.remove_matches(new_node.state.get_matches(dev1, dev2))
+                # if the board was reached before with as much score in as few
+                # swaps, this node can't do better
+                if self.dominance.dominates(new_node):
+                    continue
 
                 # append new node to the end of our queue
-
                 frontier.appendleft(new_node)
         # if this happens, we ran out of nodes without reaching our score quota
         else:
             # return node with highest score instead
             node = self.max_node
 
+        if self.checkpoint is not None:
+            self.checkpoint.finish(self)
+
+        return self.show_swaps(node)
+
+    def external_bfts(self, spill_size=SPILL_SIZE, directory=None):
+        """Generate, traverse and evaluate tree nodes breadth-first like bfts,
+        with each depth layer kept on disk instead of in memory, see
+        LayerStore. The layer being expanded is streamed back from its file,
+        and the next one only holds spill_size bytes of states in memory at a
+        time, so layers far larger than memory can be searched.
+
+        States are kept as their board and score alone, so nodes are rebuilt
+        from them as they're expanded, and the swaps of the goal (or the node
+        with highest score) are replayed from the root once it's found.
+
+        Args:
+            spill_size: The most bytes of states held in memory at once.
+            directory: Where the layer files are kept, None for the system's
+                temporary directory. They're removed once the search is over.
+
+        Returns:
+            The swaps performed by our goal node as displayed by show_swaps().
+            If no solution found, return swaps performed by node with highest
+            score.
+        """
+
+        top = self.root.state
+        swaps = top.get_swap_table()[0]
+        indices = {swap: k for k, swap in enumerate(swaps)}
+
+        store = LayerStore(len(top.board), top.num_device_types, len(swaps), spill_size,
+                           directory)
+
+        # depth and index of the node with highest score, the root at first
+        best = (top.score, 0, 0)
+
+        # swaps that reach the quota, once found
+        goal = None
+
+        try:
+            store.add(top.board, top.score, 0, 0)
+            store.finish()
+
+            for depth in range(top.max_swaps + 1):
+                for index, (board, score) in enumerate(store.read(depth)):
+                    # keep track of node with highest score
+                    if score > best[0]:
+                        best = (score, depth, index)
+
+                    # if we reach our score quota (only ever the root, as
+                    # children are checked as they're made), game over
+                    if score >= top.quota:
+                        goal = store.get_actions(depth, index)
+                        break
+
+                    # if we reach max swaps, pursue branch no further
+                    if depth >= top.max_swaps:
+                        continue
+
+                    node = self.restore(board, score, depth)
+
+                    # every child goes to the next layer, where duplicates go
+                    for action in self.get_moves(node):
+                        new_node = self.expand(node, action)
+
+                        # a goal needs no layer of its own, its parent's path
+                        # is already on disk
+                        if new_node.state.score >= top.quota:
+                            goal = store.get_actions(depth, index) + [indices[action]]
+                            break
+
+                        store.add(new_node.state.board, new_node.state.score, index,
+                                  indices[action])
+
+                    if goal is not None:
+                        break
+
+                if goal is not None or depth >= top.max_swaps or store.finish() == 0:
+                    break
+
+            # rebuild the goal, or the node with highest score instead
+            if goal is None:
+                goal = store.get_actions(*best[1:])
+
+            node = self.replay([swaps[k] for k in goal])
+        finally:
+            self.layers = {'sizes': store.counts, 'spilled': store.spilled,
+                           'dominated': store.dominated}
+            store.close()
+
+        self.max_node = node
+
         return self.show_swaps(node)
 
+    def restore(self, board, score, cost):
+        """Rebuild a node from the board and score of its state, as stored by
+        external_bfts. The node has no parent, so only its board, score and
+        cost are meaningful.
+
+        Args:
+            board: The board of the state.
+            score: The score of the state.
+            cost: The path cost of the node.
+
+        Returns:
+            The node.
+        """
+
+        node = Node(self.root.state, cost=cost)
+        state = node.state
+
+        state.board = board
+        state.score = score
+        state.key = reduce(xor, map(getitem, state.zobrist, board), 0)
+        state.moves = None
+        state.dirty = 0
+
+        return node
+
+    def expand(self, node, action):
+        """Create the child node a swap leads to, matches removed. If the same
+        swap was made on the same board before, its outcome comes from the
+        swap cache instead of being played out again.
+
+        Args:
+            node: The parent node.
+            action: The coordinates of the devices to be swapped.
+
+        Returns:
+            The new child node.
+        """
+
+        new_node = Node(node.state, action, node, node.cost)
+        state = new_node.state
+        key = (state.key, action)
+        self.nodes += 1
+        outcome = self.cache.get(key) if self.cache.max_size else None
+
+        # replaced and falling are always reset once the cascade is over, so
+        # the board, its key, the score gained and the cells written are enough
+        if outcome is None:
+            dirty, score = state.dirty, state.score
+            state.dirty = 0
+
+            new_node.perform_action()
+            waves = state.remove_matches(state.get_matches(*action))
+
+            if self.stats is not None:
+                self.stats.cascades[waves] += 1
+
+            if self.cache.max_size:
+                self.cache.put(key, (bytes(state.board), state.key,
+                                     state.score - score, state.dirty))
+
+            state.dirty |= dirty
+        else:
+            board, state.key, gain, dirty = outcome
+
+            state.board[:] = board
+            state.score += gain
+            state.dirty |= dirty
+            new_node.cost += 1
+
+        self.gain_bound = max(self.gain_bound, state.score - node.state.score)
+
+        return new_node
+
+    def rank(self, node, key=None):
+        """Compute the frontier key of a node, before it's queued.
+
+        Args:
+            node: The node, or Successor, to rank.
+            key: The function to rank it by, None for the tree's heuristic.
+
+        Returns:
+            The node's key, lowest first.
+        """
+
+        return (key or self.heuristic)(node)
+
+    def get_moves(self, node):
+        """Return the swaps of a node that would result in a match.
+
+        Args:
+            node: The node to expand.
+
+        Returns:
+            A list of device locations, see Puzzle.get_valid_moves.
+        """
+
+        return node.state.get_valid_moves()
+
+    def order_moves(self, node):
+        """Return the swaps of a node in the order the depth-first searches try
+        them: the killer moves of its depth that are valid here first, then the
+        rest by the number of devices they clear before anything falls, most
+        first (ties keep board order).
+
+        Args:
+            node: The node to expand.
+
+        Returns:
+            A list of device locations, see Puzzle.get_valid_moves.
+        """
+
+        moves = self.get_moves(node)
+
+        # the clear counts were found along with the moves, so this is cheap
+        gains = dict(node.state.get_move_gains())
+        killers = [move for move in self.killers.get(node.cost, ()) if move in gains]
+
+        moves.sort(key=gains.get, reverse=True)
+
+        return killers + [move for move in moves if move not in killers]
+
+    def add_killer(self, node, action):
+        """Remember a swap as a killer move for the depth of a node, so that
+        its siblings' subtrees try it first.
+
+        Args:
+            node: The node the swap was made on.
+            action: The coordinates of the devices swapped.
+        """
+
+        killers = self.killers.setdefault(node.cost, [])
+
+        if action in killers:
+            killers.remove(action)
+
+        killers.insert(0, action)
+        del killers[Tree.KILLERS:]
+
+    def can_reach_quota(self, node, swaps):
+        """Whether a node could still reach the quota in a number of swaps,
+        going by the most any one swap has gained so far. That bound is only
+        what has been seen, not what's possible, so pruning on it can miss a
+        goal that needs a bigger cascade than any seen yet. Nodes are only
+        ever pruned if the tree is inexact.
+
+        Args:
+            node: The node to check.
+            swaps: The number of swaps left to it.
+
+        Returns:
+            False if the node can be pruned.
+        """
+
+        if not self.inexact:
+            return True
+
+        return node.state.score + swaps*self.gain_bound >= node.state.quota
+
+    def probe(self):
+        """Play the most promising swap, from the root on, until no swaps are
+        left, so that the gain bound the depth-first searches prune on starts
+        from the cascades of a whole line of play, not just the first swaps
+        they try. Only an inexact tree prunes, so there's nothing to warm up
+        otherwise.
+        """
+
+        if not self.inexact:
+            return
+
+        node = self.root
+
+        while node.cost < node.state.max_swaps:
+            moves = self.order_moves(node)
+
+            if not moves:
+                break
+
+            node = self.expand(node, moves[0])
+
+    def get_stats(self):
+        """Returns what is known of the searches run on this tree so far.
+
+        Returns:
+            A dict of the nodes generated, the swap cache counters and the
+            dominance table counters, plus the SearchStats if they were
+            collected.
+        """
+
+        stats = {
+            'generated': self.nodes,
+            'cache': {
+                'hits': self.cache.hits,
+                'misses': self.cache.misses,
+                'evictions': self.cache.evictions,
+            },
+            'dominance': {
+                'boards': len(self.dominance),
+                'dominated': self.dominance.dominated,
+            },
+        }
+
+        if self.layers is not None:
+            stats['layers'] = self.layers
+
+        if self.stats is not None:
+            stats.update(self.stats.as_dict())
+
+        return stats
+
     def show_swaps(self, node):
         """Display swaps performed by node in an output-friendly format.
 
@@ -86,7 +523,7 @@ class Tree:
             A multi-line string representing swaps made by the node.
         """
 
-        return '\n'.join(["{},{}".format(dev1, dev2) for dev1, dev2 in node.state.swaps])
+        return '\n'.join(["{},{}".format(dev1, dev2) for dev1, dev2 in node.get_swaps()])
 
     def id_dfts(self):
         """Generate, traverse and evaluate tree nodes based on an iterative-
@@ -98,6 +535,8 @@ class Tree:
             score.
         """
 
+        self.probe()
+
         # for depth from 0 to the maximum branch depth (inclusive)
         for depth in range(self.root.state.max_swaps+1):
             node = self._dls(self.root, depth)
@@ -123,29 +562,34 @@ class Tree:
             Otherwise, return None.
         """
 
+        # keep track of node with highest score
+        if node.state.score > self.max_node.state.score:
+            self.max_node = node
+
         # if depth is 0 and quota reached (aka goal found), return goal node
         if depth == 0 and node.state.score >= node.state.quota:
             return node
 
         if depth > 0:
-            # keep track of node with highest score
-            if node.state.score >= self.max_node.state.score:
-                self.max_node = node
+            # for every valid swap, most promising first
+            for dev1, dev2 in self.order_moves(node):
+                # create the node that swapping dev1 and dev2 leads to
+                new_node = self.expand(node, (dev1, dev2))
 
-            # for every valid swap
-            for dev1, dev2 in node.state.get_valid_moves():
-                # create a new node as a copy of the current
-                new_node = Node(node.state, (dev1, dev2), node, node.cost)
-                
-                # swap dev1 and dev2
-                new_node.perform_action()
+                # skip nodes that can't make up their score in time
+                if not self.can_reach_quota(new_node, depth-1):
+                    continue
 
-                # remove any matches
-                new_node.state.remove_matches(new_node.state.get_matches(dev1, dev2))
+                best = self.max_node
 
                 # recurse on new node
                 found = self._dls(new_node, depth-1)
 
+                # a swap that led to a goal or a better score is worth trying
+                # first in the sibling subtrees
+                if found or self.max_node is not best:
+                    self.add_killer(node, (dev1, dev2))
+
                 # if goal node found, return it
                 if found:
                     return found
@@ -153,6 +597,113 @@ class Tree:
         # no goal found
         return None
 
+    def ida_star(self):
+        """Generate, traverse and evaluate tree nodes based on an iterative-
+        deepening A* approach. Each iteration is a depth-first search bounded
+        by cost plus estimated swaps to go, so only the path being searched is
+        held in memory, however many swaps are allowed.
+
+        Returns:
+            The swaps performed by our goal node as displayed by show_swaps().
+            If no solution found, return swaps performed by node with highest
+            score.
+        """
+
+        self.probe()
+
+        bound = self.root.cost + self.estimate(self.root)
+
+        # each iteration raises the bound to the lowest one that was exceeded
+        while bound < math.inf:
+            node, bound = self._bounded_dfs(self.root, bound)
+
+            # if node isn't None, it's a goal node
+            if node:
+                return self.show_swaps(node)
+
+        # if no solution found, return node with highest score
+        return self.show_swaps(self.max_node)
+
+    def estimate(self, node):
+        """Estimate the swaps still needed to reach the quota from a node, as
+        if every swap cleared as many devices as the best one available now.
+
+        Args:
+            node: The node to estimate.
+
+        Returns:
+            The estimated number of swaps, or infinity if no swap is left.
+        """
+
+        remaining = node.state.quota - node.state.score
+
+        if remaining <= 0:
+            return 0
+
+        best = node.state.get_best_gain()
+
+        return math.ceil(remaining / best) if best else math.inf
+
+    def _bounded_dfs(self, node, bound):
+        """Traverse child nodes depth-first, as long as their cost plus
+        estimate stays within the bound.
+
+        Args:
+            node: The base node to traverse.
+            bound: The highest cost plus estimate to traverse.
+
+        Returns:
+            A tuple of the goal node (None if not found) and the lowest cost
+            plus estimate of the nodes beyond the bound.
+        """
+
+        # keep track of node with highest score
+        if node.state.score > self.max_node.state.score:
+            self.max_node = node
+
+        # if quota reached (aka goal found), return goal node
+        if node.state.score >= node.state.quota:
+            return node, bound
+
+        f = node.cost + self.estimate(node)
+
+        # if we've gone past the bound, report how far
+        if f > bound:
+            return None, f
+
+        # if we reach max swaps, pursue branch no further
+        if node.cost >= node.state.max_swaps:
+            return None, math.inf
+
+        next_bound = math.inf
+
+        # for every valid swap, most promising first
+        for action in self.order_moves(node):
+            new_node = self.expand(node, action)
+
+            # skip nodes that can't make up their score in time
+            if not self.can_reach_quota(new_node, node.state.max_swaps - new_node.cost):
+                continue
+
+            best = self.max_node
+
+            # recurse on new node
+            found, f = self._bounded_dfs(new_node, bound)
+
+            # a swap that led to a goal or a better score is worth trying first
+            # in the sibling subtrees
+            if found or self.max_node is not best:
+                self.add_killer(node, action)
+
+            # if goal node found, return it
+            if found:
+                return found, bound
+
+            next_bound = min(next_bound, f)
+
+        # no goal found
+        return None, next_bound
+
     def grbefgs(self):
         """Generate, traverse and evaluate tree nodes based on a greedy best-
         first approach using a custom heuristic.
@@ -166,18 +717,22 @@ class Tree:
         # create a priority queue for our heuristic, which is quota - score
         frontier = PriorityQueue(lambda node: node.state.quota-node.state.score, [self.root])
 
-        # graph search, so explored set
-        explored = []
+        # graph search, so explored set of nodes that have been expanded
+        explored = set()
+
+        # best score and cost seen for each board, so beaten states are dropped
+        self.dominance = DominanceTable()
+        self.dominance.dominates(self.root)
+
+        # time the frontier and explored set if we're collecting stats
+        if self.stats is not None:
+            explored = TimedSet(self.stats)
+            self.stats.watch_queue(frontier)
 
         # while we still have nodes to evaluate
         while len(frontier) > 0:
             node = frontier.dequeue()
-
-            # if we've seen the node before, skip it
-            if new_node in explored:
-                continue
-            else:
-                explored.append(new_node)
+            explored.add(node)
 
             # keep track of node with highest score
             if node.state.score > self.max_node.state.score:
@@ -192,17 +747,21 @@ class Tree:
                 break
             
             # for every valid swap
-            for dev1, dev2 in node.state.get_valid_moves():
-                # create a new node as a copy of the current
-                new_node = Node(node.state, (dev1, dev2), node, node.cost)
+            for dev1, dev2 in self.get_moves(node):
+                # create the node that swapping dev1 and dev2 leads to
+                new_node = self.expand(node, (dev1, dev2))
 
-                # swap dev1 and dev2
-                new_node.perform_action()
+                # if the board was reached before with as much score in as few
+                # swaps, this node can't do better
+                if self.dominance.dominates(new_node):
+                    continue
 
-                # remove any matches
-                new_node.state.remove_matches(new_node.state.get_matches(dev1, dev2))
+                # if we've expanded the node before, don't queue it again
+                if new_node in explored:
+                    continue
 
-                # append new node to our queue
+                # append new node to our queue, replacing a queued duplicate
+                # if this one comes out first
                 frontier.enqueue(new_node)
         # if this happens, we ran out of nodes without reaching our score quota
         else:
@@ -211,31 +770,48 @@ class Tree:
 
         return self.show_swaps(node)
 
-    def astargs(self):
+    def astargs(self, incumbent=None):
         """Generate, traverse and evaluate tree nodes based on an A* approach
         using a custom heuristic.
 
+        Args:
+            incumbent: A pair of multiprocessing.Values shared with searches
+                of other subtrees, the fewest swaps any of them reached the
+                quota in and that goal's score, see parallel_astargs. Nodes
+                whose children couldn't reach the quota in as few swaps aren't
+                expanded.
+
         Returns:
             The swaps performed by our goal node as displayed by show_swaps().
             If no solution found, return swaps performed by node with highest
             score.
         """
 
-        # create a priority queue for our heuristic, which is (quota - score) * cost
-        frontier = PriorityQueue(lambda node: (node.state.quota-node.state.score)*node.cost, [self.root])
+        # create a priority queue for our heuristic, which ranks a lazy tree's
+        # children by their successors until they're dequeued and created
+        frontier = PriorityQueue(self.heuristic)
 
-        # graph search, so explored set
-        explored = []
+        # graph search, so explored set of nodes that have been expanded
+        explored = set()
 
-        # while we still have nodes to evaluate
-        while len(frontier) > 0:
-            node = frontier.dequeue()
+        # best score and cost seen for each board, so beaten states are dropped
+        self.dominance = DominanceTable()
+        self.dominance.dominates(self.root)
 
-            # if we've seen the node before, skip it
-            if node in explored:
-                continue
-            else:
-                explored.append(node)
+        # time the frontier and explored set if we're collecting stats
+        if self.stats is not None:
+            explored = TimedSet(self.stats)
+            self.stats.watch_queue(frontier)
+
+        node = self.root
+
+        # pick up where a checkpointed search left off, its next node first
+        if self.checkpoint is not None:
+            node = self.checkpoint.start(self, frontier, explored) or self.root
+
+        # while we still have nodes to evaluate
+        while node is not None:
+            explored.add(node)
 
             # keep track of node with highest score
             if node.state.score > self.max_node.state.score:
@@ -245,28 +821,333 @@ class Tree:
             if node.state.score >= node.state.quota:
                 break
 
-            # if we reach max swaps, pursue branch no further
-            if node.cost >= node.state.max_swaps:
-                continue
-            
-            # for every valid swap
-            for dev1, dev2 in node.state.get_valid_moves():
-                # create a new node as a copy of the current
-                new_node = Node(node.state, (dev1, dev2), node, node.cost)
+            # the most swaps a goal may take, no more than the incumbent's if
+            # another search reached the quota, as it can't be beaten otherwise
+            max_swaps = node.state.max_swaps
 
-                # swap dev1 and dev2
-                new_node.perform_action()
+            if incumbent is not None:
+                max_swaps = min(max_swaps, incumbent[0].value)
 
-                # remove any matches
-                new_node.state.remove_matches(new_node.state.get_matches(dev1, dev2))
+            # unless we reach max swaps, queue a child for every valid swap
+            if node.cost < max_swaps and self.lazy:
+                # as a successor, without making the swap yet
+                moves = self.get_moves(node)
+                gains = dict(node.state.get_move_gains())
 
-                # append new node to our queue
-                frontier.enqueue(new_node)
+                for action in moves:
+                    successor = Successor(node, action, gains[action])
+                    frontier.enqueue(successor, self.rank(successor))
+            elif node.cost < max_swaps:
+                for dev1, dev2 in self.get_moves(node):
+                    # create the node that swapping dev1 and dev2 leads to
+                    new_node = self.expand(node, (dev1, dev2))
+
+                    # if the board was reached before with as much score in as
+                    # few swaps, this node can't do better
+                    if self.dominance.dominates(new_node):
+                        continue
+
+                    # if we've expanded the node before, don't queue it again
+                    if new_node in explored:
+                        continue
+
+                    # append new node to our queue, replacing a queued
+                    # duplicate if this one comes out first
+                    frontier.enqueue(new_node, self.rank(new_node))
+
+            node = self.next_node(frontier, explored)
 
         # if this happens, we ran out of nodes without reaching our score quota
         else:
             # return node with highest score instead
             node = self.max_node
 
-        print(node.state.score)
+        if self.checkpoint is not None:
+            self.checkpoint.finish(self)
+
         return self.show_swaps(node)
+
+    def next_node(self, frontier, explored):
+        """Dequeue the next node to expand. In a lazy tree, a successor that
+        reaches the front has its child created and queued again, ranked as
+        the child.
+
+        Args:
+            frontier: A PriorityQueue of nodes, or of Successor instances if
+                the tree is lazy.
+            explored: The nodes that have been expanded.
+
+        Returns:
+            The node to expand, or None if the frontier runs out.
+        """
+
+        if not self.lazy:
+            return frontier.dequeue() if len(frontier) > 0 else None
+
+        while len(frontier) > 0:
+            successor = frontier.dequeue()
+
+            # the child was created and is still first as itself
+            if successor.node is not None:
+                if successor.node not in explored:
+                    return successor.node
+
+                continue
+
+            successor.node = self.expand(successor.parent, successor.action)
+
+            # if the board was reached before with as much score in as few
+            # swaps, or we've expanded the node before, it can't do better
+            if self.dominance.dominates(successor.node) or successor.node in explored:
+                continue
+
+            frontier.enqueue(successor, self.rank(successor))
+
+        return None
+
+    def beam(self, width=BEAM_WIDTH, seed=None):
+        """Generate, traverse and evaluate tree nodes a depth at a time,
+        keeping only the width children with the highest score at each depth.
+        This gives up on finding the best solution in exchange for a cost
+        linear in width times max swaps, however big the board.
+
+        Args:
+            width: The most nodes kept at each depth.
+            seed: If not None, keep a random sample of the children instead,
+                favouring higher scores (stochastic beam search), drawn with
+                this seed.
+
+        Returns:
+            The swaps performed by our goal node as displayed by show_swaps().
+            If no solution found, return swaps performed by node with highest
+            score.
+        """
+
+        rng = random.Random(seed) if seed is not None else None
+
+        # rank children by score, or by score perturbed with gumbel noise,
+        # which makes the top width a sample weighted towards higher scores
+        if rng is None:
+            rank = lambda node: node.state.score
+        else:
+            rank = lambda node: node.state.score - math.log(rng.expovariate(1))
+
+        # the nodes at the current depth
+        beam = [self.root]
+
+        # best score and cost seen for each board, so repeats are dropped
+        self.dominance = DominanceTable()
+        self.dominance.dominates(self.root)
+
+        # if we reach our score quota, game over
+        if self.root.state.score >= self.root.state.quota:
+            return self.show_swaps(self.root)
+
+        # while we still have nodes to evaluate
+        while beam:
+            children = []
+
+            for node in beam:
+                # if we reach max swaps, pursue branch no further
+                if node.cost >= node.state.max_swaps:
+                    continue
+
+                # for every valid swap
+                for dev1, dev2 in self.get_moves(node):
+                    # create the node that swapping dev1 and dev2 leads to
+                    new_node = self.expand(node, (dev1, dev2))
+
+                    # if the board was reached before with as much score in as
+                    # few swaps, this node can't do better
+                    if self.dominance.dominates(new_node):
+                        continue
+
+                    children.append(new_node)
+
+                    # keep track of node with highest score, as a sampled
+                    # beam may leave it out
+                    if new_node.state.score > self.max_node.state.score:
+                        self.max_node = new_node
+
+            # if we reach our score quota, game over, before the goal can be
+            # left out of the beam too
+            if self.max_node.state.score >= self.max_node.state.quota:
+                return self.show_swaps(self.max_node)
+
+            beam = heapq.nlargest(width, children, key=rank)
+
+        # if this happens, we ran out of nodes without reaching our score quota
+        return self.show_swaps(self.max_node)
+
+    def anytime_astargs(self, budget, on_improve=None):
+        """Generate, traverse and evaluate tree nodes based on an anytime
+        weighted A* approach. The first round orders nodes the way astargs
+        does, which finds a first answer quickest. Each later round is an A*
+        search on cost plus a weighted estimate of the swaps to go, looking
+        only for answers with fewer swaps, the weight relaxing round by round.
+        Rounds stop early once time runs out, and max_node always holds the
+        best answer found so far.
+
+        Args:
+            budget: Seconds the search may take.
+            on_improve: A function called with each node that becomes the best
+                answer, so that it can be saved as soon as it's found.
+
+        Returns:
+            The swaps performed by the best node found as displayed by
+            show_swaps().
+        """
+
+        deadline = default_timer() + budget
+
+        keys = [self.heuristic]
+        keys += [lambda node, weight=weight: node.cost + weight*self.estimate(node)
+                 for weight in Tree.ANYTIME_WEIGHTS]
+
+        for key in keys:
+            frontier = PriorityQueue(key, [self.root])
+
+            # cheapest cost each node was expanded at, since reaching a board
+            # with fewer swaps leaves more swaps to improve on it
+            explored = {}
+
+            if self.stats is not None:
+                self.stats.watch_queue(frontier)
+
+            while len(frontier) > 0:
+                # once out of time, settle for the best answer so far
+                if default_timer() >= deadline:
+                    return self.show_swaps(self.max_node)
+
+                node = frontier.dequeue()
+                explored[node] = node.cost
+
+                if self.improves(node):
+                    self.max_node = node
+
+                    if on_improve:
+                        on_improve(node)
+
+                # if we reach our score quota, this round is over
+                if node.state.score >= node.state.quota:
+                    break
+
+                # if we reach max swaps, or can't beat the best goal's swaps
+                # anymore, pursue branch no further
+                best = self.max_node
+                if (node.cost >= node.state.max_swaps or
+                        best.state.score >= best.state.quota and node.cost + 1 >= best.cost):
+                    continue
+
+                # for every valid swap
+                for dev1, dev2 in self.get_moves(node):
+                    # create the node that swapping dev1 and dev2 leads to
+                    new_node = self.expand(node, (dev1, dev2))
+
+                    # if we've expanded the node before at no more cost, don't
+                    # queue it again
+                    if explored.get(new_node, math.inf) <= new_node.cost:
+                        continue
+
+                    frontier.enqueue(new_node, self.rank(new_node, key))
+
+        return self.show_swaps(self.max_node)
+
+    def improves(self, node):
+        """Tests whether a node is a better answer than max_node. Any goal beats
+        a node short of the quota, goals are compared on swaps and then score,
+        and nodes short of the quota on score alone.
+
+        Args:
+            node: The node to test.
+
+        Returns:
+            True if the node is the better answer, False otherwise.
+        """
+
+        best = self.max_node
+        is_goal = node.state.score >= node.state.quota
+        best_is_goal = best.state.score >= best.state.quota
+
+        if is_goal != best_is_goal:
+            return is_goal
+
+        if is_goal and node.cost != best.cost:
+            return node.cost < best.cost
+
+        return node.state.score > best.state.score
+
+    def parallel_astargs(self, workers):
+        """Run astargs on several CPU cores by splitting the tree at the root.
+        Each subtree below one of the root's valid swaps is searched by its own
+        worker process, handed out as workers become free. The workers share
+        an incumbent, the fewest swaps any of them reached the quota in, and
+        stop expanding nodes that can't match it. Every subtree's result is
+        waited for and the best kept, so the search does at least as well as
+        astargs, whose goal is the first goal of one of the subtrees.
+
+        Args:
+            workers: The number of worker processes.
+
+        Returns:
+            The swaps performed by our goal node as displayed by show_swaps().
+            If no solution found, return swaps performed by node with highest
+            score.
+        """
+
+        root = self.root
+        moves = root.state.get_valid_moves()
+
+        # nothing to split, so there's nothing to gain from workers either
+        if (root.state.score >= root.state.quota or
+                root.cost >= root.state.max_swaps or len(moves) < 2):
+            return self.astargs()
+
+        # a goal one swap away can't be beaten on swaps, so it needs no workers
+        children = [self.expand(root, move) for move in moves]
+        nodes = [node for node in children if node.state.score >= node.state.quota]
+
+        if not nodes:
+            swaps = multiprocessing.Value('i', root.state.max_swaps + 1)
+            score = multiprocessing.Value('i', 0)
+            search = partial(_search_subtree, root, cache_size=self.cache.max_size,
+                             heuristic=self.heuristic, lazy=self.lazy)
+
+            # hand out the subtrees in the order astargs would start on them,
+            # so that an incumbent turns up early to prune the others
+            moves = [node.action for node in sorted(children, key=self.rank)]
+
+            with multiprocessing.Pool(workers, initializer=_init_worker,
+                                      initargs=(swaps, score)) as pool:
+                nodes = [self.replay(result) for result in pool.imap_unordered(search, moves)]
+
+        # prefer the goal with fewest swaps (then highest score), otherwise the
+        # highest score
+        goals = [node for node in nodes if node.state.score >= node.state.quota]
+
+        if goals:
+            node = min(goals, key=lambda node: (node.cost, -node.state.score))
+        else:
+            node = max(nodes, key=lambda node: node.state.score)
+
+        if node.state.score > self.max_node.state.score:
+            self.max_node = node
+
+        return self.show_swaps(node)
+
+    def replay(self, swaps):
+        """Rebuild the node reached by performing swaps from the root.
+
+        Args:
+            swaps: The swaps to perform, in order.
+
+        Returns:
+            The node the swaps lead to.
+        """
+
+        node = self.root
+
+        for action in swaps[node.cost:]:
+            node = self.expand(node, action)
+
+        return node